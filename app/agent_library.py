@@ -0,0 +1,88 @@
+"""
+Bulk import and export of the agent library.
+
+Agents are stored as records in the create_agent format: name, expertise,
+description, agent_type, prompt, required_params (comma-separated) and an
+optional configs object. Files ending in .jsonl hold one record per line;
+any other file holds a JSON array. Imports run in a single transaction and
+match existing agents by name.
+
+    python agent_library.py export agents.jsonl
+    python agent_library.py import agents.jsonl
+    python agent_library.py import agents.json --replace
+"""
+import argparse
+import json
+import sys
+import time
+
+from database import Database
+
+REQUIRED_FIELDS = ('name', 'expertise', 'description', 'agent_type', 'prompt', 'required_params')
+
+
+def read_records(path):
+    """Read agent records from a JSON or JSONL file, checking required fields"""
+    with open(path, encoding='utf-8') as f:
+        if path.lower().endswith('.jsonl'):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = json.load(f)
+
+    for number, record in enumerate(records, start=1):
+        missing = [field for field in REQUIRED_FIELDS if not record.get(field)]
+        if missing:
+            raise ValueError(f"Record {number} is missing: {', '.join(missing)}")
+    return records
+
+
+def write_records(records, f, jsonl=True):
+    """Write records to an open file as they are produced; returns the count"""
+    count = 0
+    if not jsonl:
+        f.write('[')
+    for record in records:
+        if jsonl:
+            f.write(json.dumps(record) + '\n')
+        else:
+            f.write((',\n' if count else '\n') + json.dumps(record, indent=2))
+        count += 1
+    if not jsonl:
+        f.write('\n]\n')
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import or export the agent library")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help="load agents from a JSON or JSONL file")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--replace', action='store_true',
+                               help="remove every agent that is not in the file")
+
+    export_parser = subparsers.add_parser('export', help="write active agents to a JSON or JSONL file")
+    export_parser.add_argument('path', help="output file, or - for JSONL on stdout")
+    args = parser.parse_args()
+
+    db = Database()
+    started = time.time()
+    if args.command == 'import':
+        try:
+            records = read_records(args.path)
+        except (OSError, ValueError) as e:
+            parser.exit(1, f"Error reading {args.path}: {e}\n")
+        created, updated, removed = db.import_agents(records, replace=args.replace)
+        print(f"Imported {len(records)} agents in {time.time() - started:.2f}s: "
+              f"{created} created, {updated} updated, {removed} removed")
+    elif args.path == '-':
+        write_records(db.iter_export_agents(), sys.stdout)
+    else:
+        with open(args.path, 'w', encoding='utf-8') as f:
+            count = write_records(db.iter_export_agents(), f, jsonl=args.path.lower().endswith('.jsonl'))
+        print(f"Exported {count} agents in {time.time() - started:.2f}s")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
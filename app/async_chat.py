@@ -0,0 +1,173 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+
+from metrics import CallTimer
+from openai_client import OPENAI_BASE_URL, get_async_client
+from prompts import MODEL_SETTINGS, build_chat_request, compile_prompt
+from resilience import CALL_DEADLINE, DeadlineExceededError, acall_with_retries, describe_error, get_breaker
+from response_cache import get_response_cache
+
+# Maximum number of agents answering at the same time in one fan-out
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "4"))
+# Seconds fan_out waits for the next event before giving up on the agents still answering
+FANOUT_EVENT_TIMEOUT = CALL_DEADLINE + 30
+
+# Event kinds yielded by fan_out
+DELTA = 'delta'
+DONE = 'done'
+ERROR = 'error'
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop():
+    """
+    Get the process-wide event loop, started on a daemon thread on first use.
+
+    Streamlit scripts run on their own threads without a loop, and async
+    clients are tied to the loop they were used on, so every async call in the
+    process is scheduled onto this one loop.
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-chat", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+async def _stream_agent(api_key, agent, user_input, params, semaphore, events):
+    """Stream one agent's answer into the events queue, always ending with DONE or ERROR"""
+    timer = None
+    usage = None
+    error = None
+    try:
+        # Queue time covers waiting for a concurrency slot
+        timer = CallTimer(agent)
+        async with semaphore:
+            timer.started()
+            client = get_async_client(api_key).with_options(max_retries=0)
+            request = build_chat_request(agent, user_input, params)
+            deadline_at = time.monotonic() + CALL_DEADLINE
+            stream = await acall_with_retries(
+                lambda timeout: client.chat.completions.create(
+                    **request, stream=True, stream_options={"include_usage": True}, timeout=timeout
+                ),
+                deadline=CALL_DEADLINE,
+                breaker=get_breaker(OPENAI_BASE_URL),
+                on_retry=timer.retried
+            )
+            async with stream:
+                async for chunk in stream:
+                    if time.monotonic() > deadline_at:
+                        raise DeadlineExceededError("The response took too long and was cut off.")
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        timer.first_token()
+                        events.put((agent.id, DELTA, chunk.choices[0].delta.content))
+    except Exception as e:
+        error = e
+
+    # Report the outcome even if recording the metrics fails
+    try:
+        if timer is not None:
+            timer.finish(usage, error=error)
+    finally:
+        if error is None:
+            events.put((agent.id, DONE, None))
+        else:
+            events.put((agent.id, ERROR, describe_error(error)))
+
+
+async def _fan_out(api_key, agents, user_input, params, max_concurrency, events):
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # One agent failing after it reported must not cut off the others
+    results = await asyncio.gather(*(
+        _stream_agent(api_key, agent, user_input, params, semaphore, events)
+        for agent in agents
+    ), return_exceptions=True)
+    for agent, result in zip(agents, results):
+        if isinstance(result, asyncio.CancelledError):
+            events.put((agent.id, ERROR, "The request was cancelled. Please try again."))
+        elif isinstance(result, Exception):
+            print(f"Error in agent fan-out: {result!r}")
+
+
+def _report_failure(events):
+    """Done-callback for the fan-out future that tells fan_out if it died"""
+    def callback(future):
+        if future.cancelled():
+            events.put((None, ERROR, "The request was cancelled. Please try again."))
+        elif future.exception() is not None:
+            events.put((None, ERROR, describe_error(future.exception())))
+    return callback
+
+
+def fan_out(api_key, agents, user_input, params=None, max_concurrency=FANOUT_CONCURRENCY):
+    """
+    Send one user input to several agents at once and stream their answers.
+
+    Yields (agent_id, kind, payload) events on the calling thread: DELTA with
+    a text chunk, then DONE with the full response or ERROR with a message.
+    At most max_concurrency agents are in flight; cached responses are
+    answered without a request.
+    """
+    cache = get_response_cache()
+    events = queue.Queue()
+    keys = {}
+    pending = []
+    for agent in agents:
+        keys[agent.id] = cache.make_key(
+            agent.id, agent.prompt_version, MODEL_SETTINGS, user_input, params,
+            compile_prompt(agent).fingerprint
+        )
+        cached = cache.get(keys[agent.id])
+        if cached is not None:
+            events.put((agent.id, DELTA, cached))
+            events.put((agent.id, DONE, None))
+        else:
+            pending.append(agent)
+
+    if pending:
+        future = asyncio.run_coroutine_threadsafe(
+            _fan_out(api_key, pending, user_input, params, max_concurrency, events),
+            _get_loop()
+        )
+        future.add_done_callback(_report_failure(events))
+
+    requested = {agent.id: agent for agent in pending}
+    # Accumulate the text here so finished answers can be cached from this thread
+    responses = {agent.id: [] for agent in agents}
+    finished = set()
+    remaining = len(agents)
+    while remaining:
+        try:
+            agent_id, kind, payload = events.get(timeout=FANOUT_EVENT_TIMEOUT)
+        except queue.Empty:
+            agent_id, kind, payload = None, ERROR, "The agents stopped responding. Please try again."
+        if agent_id is None:
+            # The fan-out died or stalled: fail every agent still answering
+            for agent in agents:
+                if agent.id not in finished:
+                    yield agent.id, ERROR, payload
+            return
+        if kind == DELTA:
+            responses[agent_id].append(payload)
+            yield agent_id, kind, payload
+            continue
+
+        remaining -= 1
+        finished.add(agent_id)
+        if kind == DONE:
+            payload = ''.join(responses[agent_id])
+            agent = requested.get(agent_id)
+            if payload and agent is not None:
+                cache.put(keys[agent_id], agent_id, agent.prompt_version, payload)
+        yield agent_id, kind, payload
@@ -0,0 +1,209 @@
+"""
+Headless batch runner for agent reports.
+
+Reads jobs from a JSONL or CSV file, renders each agent's prompt, runs the
+jobs on a bounded worker pool with retries and streams results to a JSONL
+file. Jobs already completed in the output file are skipped, so an
+interrupted run can simply be started again.
+
+JSONL jobs look like {"id": "...", "agent": "Competition Overview Agent",
+"params": {"market_category": "EV charging"}, "question": "..."}. In CSV
+files the "id", "agent" and "question" columns are read and every other
+column becomes a parameter. "id" is optional in both.
+
+    python batch_reports.py jobs.jsonl --output reports.jsonl --workers 8
+    python batch_reports.py jobs.csv --output reports.jsonl --base-url http://127.0.0.1:8000/v1
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from database import Database
+from metrics import CallTimer
+from openai_client import get_client
+from prompts import build_chat_request, compile_prompt
+from resilience import is_retryable, retry_delay
+
+
+def load_jobs(path):
+    """Yield job dicts from a JSONL or CSV file"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            for row in csv.DictReader(f):
+                job = {
+                    'id': row.pop('id', None) or None,
+                    'agent': row.pop('agent'),
+                    'question': row.pop('question')
+                }
+                job['params'] = {key: value for key, value in row.items() if value}
+                yield job
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def job_id(job):
+    """The job's own id, or a stable hash of its contents"""
+    if job.get('id'):
+        return str(job['id'])
+    payload = json.dumps([job['agent'], job.get('params') or {}, job['question']], sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def completed_job_ids(output_path):
+    """Ids of jobs that already succeeded in an earlier run (the checkpoint)"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written last line from an interrupted run
+                continue
+            if result.get('status') == 'ok':
+                done.add(result['id'])
+    return done
+
+
+class BatchRunner:
+    def __init__(self, agents, client, output, retries=5, base_delay=1.0, max_delay=60.0):
+        self.agents = {agent.name: agent for agent in agents}
+        # Retries are handled here, with rate-limit-aware backoff
+        self.client = client.with_options(max_retries=0)
+        self.output = output
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._write_lock = threading.Lock()
+
+    def run_job(self, job, submitted_at=None):
+        """Run one job and write its result line; submitted_at is its perf_counter queue time"""
+        result = {
+            'id': job_id(job),
+            'agent': job['agent'],
+            'params': job.get('params') or {},
+            'question': job['question']
+        }
+        started = time.time()
+        attempts = 0
+        try:
+            agent = self.agents.get(job['agent'])
+            if agent is None:
+                raise ValueError(f"Unknown agent: {job['agent']}")
+            missing = compile_prompt(agent).missing(result['params'])
+            if missing:
+                raise ValueError(f"Missing parameters: {', '.join(missing)}")
+            request = build_chat_request(agent, job['question'], result['params'])
+            result['prompt_version'] = agent.prompt_version
+            timer = CallTimer(agent, submitted_at)
+            timer.started()
+
+            while True:
+                attempts += 1
+                try:
+                    response = self.client.chat.completions.create(**request)
+                    break
+                except Exception as e:
+                    if attempts > self.retries or not is_retryable(e):
+                        timer.finish(error=e)
+                        raise
+                    timer.retried()
+                    time.sleep(retry_delay(e, attempts - 1, self.base_delay, self.max_delay))
+            timer.first_token()
+            timer.finish(response.usage)
+
+            result['status'] = 'ok'
+            result['response'] = response.choices[0].message.content
+            if response.usage:
+                result['usage'] = {
+                    'prompt_tokens': response.usage.prompt_tokens,
+                    'completion_tokens': response.usage.completion_tokens
+                }
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+
+        result['attempts'] = attempts
+        result['latency'] = round(time.time() - started, 3)
+        self._write(result)
+        return result
+
+    def _write(self, result):
+        with self._write_lock:
+            self.output.write(json.dumps(result) + '\n')
+            self.output.flush()
+
+    def run(self, jobs, workers):
+        """Run jobs with at most `workers` in flight; returns (ok, failed) counts"""
+        ok = failed = 0
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for job in jobs:
+                # Keep submission bounded so huge job files aren't read into memory
+                if len(in_flight) >= workers * 2:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        if future.result()['status'] == 'ok':
+                            ok += 1
+                        else:
+                            failed += 1
+                in_flight.add(executor.submit(self.run_job, job, time.perf_counter()))
+
+            for future in wait(in_flight).done:
+                if future.result()['status'] == 'ok':
+                    ok += 1
+                else:
+                    failed += 1
+        return ok, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run agent report jobs in batch")
+    parser.add_argument('jobs', help="JSONL or CSV file of jobs")
+    parser.add_argument('--output', required=True, help="JSONL file results are appended to")
+    parser.add_argument('--workers', type=int, default=4, help="concurrent requests")
+    parser.add_argument('--retries', type=int, default=5, help="retries per job on 429/5xx/network errors")
+    parser.add_argument('--base-delay', type=float, default=1.0, help="initial backoff in seconds")
+    parser.add_argument('--max-delay', type=float, default=60.0, help="longest backoff in seconds")
+    parser.add_argument('--api-key', default=os.getenv("OPENAI_API_KEY"), help="defaults to $OPENAI_API_KEY")
+    parser.add_argument('--base-url', default=None, help="OpenAI-compatible endpoint, e.g. a local mock server")
+    parser.add_argument('--no-resume', action='store_true', help="rerun jobs already completed in --output")
+    args = parser.parse_args()
+
+    if not args.api_key:
+        parser.error("an API key is required (--api-key or OPENAI_API_KEY)")
+
+    done = set() if args.no_resume else completed_job_ids(args.output)
+    jobs = (job for job in load_jobs(args.jobs) if job_id(job) not in done)
+    if done:
+        print(f"Resuming: skipping {len(done)} completed jobs")
+
+    db = Database()
+    client = get_client(args.api_key, args.base_url)
+    with open(args.output, 'a', encoding='utf-8') as output:
+        runner = BatchRunner(
+            db.get_agents(),
+            client,
+            output,
+            retries=args.retries,
+            base_delay=args.base_delay,
+            max_delay=args.max_delay
+        )
+        ok, failed = runner.run(jobs, args.workers)
+    db.close()
+
+    print(f"Finished: {ok} succeeded, {failed} failed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Benchmarks for the database and chat hot paths.
+
+Seeds a database with agents, prompt versions and parameters, times the
+Database read and write paths under increasing thread counts, then drives
+process_agent_query / stream_agent_query against the local mock OpenAI
+server. Results are written as JSON; pass an earlier results file with
+--compare to see the change in throughput and p95 for every case.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --agents 5000 --threads 1,8,64 --latency 0.2 --stream --compare bench.json
+
+The database, response cache and metrics files live in a temporary
+directory unless --db is given, so agents.db is only touched on request.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_THREADS = '1,2,4,8,16,32,64'
+
+
+def percentiles(samples):
+    """Summary of latency samples (seconds) in milliseconds"""
+    samples = sorted(samples)
+    if not samples:
+        return {}
+
+    def at(q):
+        return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 3)
+
+    return {
+        'p50_ms': at(0.50),
+        'p95_ms': at(0.95),
+        'p99_ms': at(0.99),
+        'max_ms': round(samples[-1] * 1000, 3),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 3)
+    }
+
+
+def run_threads(operation, threads, ops_per_thread):
+    """Run operation(thread, i) ops_per_thread times on each of `threads` threads"""
+    latencies = [[] for _ in range(threads)]
+    errors = [0] * threads
+    start = threading.Barrier(threads + 1)
+
+    def worker(thread):
+        start.wait()
+        for i in range(ops_per_thread):
+            began = time.perf_counter()
+            try:
+                operation(thread, i)
+            except Exception:
+                errors[thread] += 1
+            latencies[thread].append(time.perf_counter() - began)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(worker, thread) for thread in range(threads)]
+        start.wait()
+        began = time.perf_counter()
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - began
+
+    samples = [latency for thread_latencies in latencies for latency in thread_latencies]
+    return {
+        'threads': threads,
+        'ops': len(samples),
+        'seconds': round(elapsed, 4),
+        'ops_per_sec': round(len(samples) / elapsed, 1) if elapsed else None,
+        'errors': sum(errors),
+        **percentiles(samples)
+    }
+
+
+def seed(db, agents, versions, params):
+    """Load `agents` agents with `params` parameters and `versions` prompt versions each"""
+    param_names = [f'param_{i}' for i in range(params)]
+    placeholders = ' '.join(f'{{{name}}}' for name in param_names)
+    for version in range(1, versions + 1):
+        db.import_agents(
+            {
+                'name': f'Bench Agent {i}',
+                'expertise': random.choice(['Market Research', 'Pricing Strategy', 'Customer Insight']),
+                'description': f'Benchmark agent {i} for load testing.',
+                'agent_type': 'benchmark',
+                'prompt': f'Version {version} of agent {i}. Analyse {placeholders} in depth. ' * 5,
+                'required_params': ','.join(param_names) or 'topic',
+                'configs': {'temperature': 0.7}
+            }
+            for i in range(agents)
+        )
+    return [agent.id for agent in db.get_agents()]
+
+
+def bench_database(db, agent_ids, thread_counts, read_ops, write_ops):
+    """Time the Database read and write paths at every thread count"""
+    param_names = ','.join(db.get_agent_details(agent_ids[0]).parameters)
+    run_id = int(time.time())
+
+    def agent_data(name):
+        return {
+            'name': name,
+            'expertise': 'Benchmarking',
+            'description': 'Created by the benchmark.',
+            'agent_type': 'benchmark',
+            'prompt': f'Prompt written at {time.perf_counter()}',
+            'required_params': param_names
+        }
+
+    sequence = itertools.count()
+
+    def create_agent(thread, i):
+        db.create_agent(agent_data(f'Bench New {run_id}-{next(sequence)}'))
+
+    def update_agent(thread, i):
+        agent_id = random.choice(agent_ids)
+        db.update_agent(agent_id, agent_data(db.get_agent_details(agent_id).name))
+
+    def reload_catalog(thread, i):
+        # A full catalog query, as after another process's write
+        db.invalidate_catalog()
+        db.get_agents()
+
+    cases = {
+        'get_agents': (lambda thread, i: db.get_agents(), read_ops),
+        'get_agent_details': (lambda thread, i: db.get_agent_details(random.choice(agent_ids)), read_ops),
+        'catalog_reload': (reload_catalog, max(1, read_ops // 20)),
+        'create_agent': (create_agent, write_ops),
+        'update_agent': (update_agent, write_ops),
+    }
+
+    results = {}
+    for name, (operation, ops) in cases.items():
+        results[name] = []
+        for threads in thread_counts:
+            result = run_threads(operation, threads, ops)
+            results[name].append(result)
+            print(f"  {name:<18} {threads:>3} threads  {result['ops_per_sec']:>10} ops/s  "
+                  f"p95 {result['p95_ms']:>9} ms  errors {result['errors']}")
+    return results
+
+
+def bench_llm(db, agent_ids, requests, concurrency, stream, mock_config):
+    """Drive the chat call path against the mock server"""
+    from mock_openai import start_server
+
+    server, base_url = start_server(**mock_config)
+    # The client modules read their endpoint at import time
+    os.environ['OPENAI_BASE_URL'] = base_url
+    from utils import process_agent_query, stream_agent_query
+
+    agents = [db.get_agent_details(agent_id) for agent_id in agent_ids[:50]]
+    ttfts = []
+
+    def operation(thread, i):
+        agent = agents[(thread * requests + i) % len(agents)]
+        params = {name: 'benchmark' for name in agent.parameters}
+        # A unique question per call so the response cache never answers
+        question = f'Benchmark question {thread}-{i}-{time.perf_counter()}'
+        if stream:
+            began = time.perf_counter()
+            for n, _ in enumerate(stream_agent_query('bench-key', agent, question, params)):
+                if n == 0:
+                    ttfts.append(time.perf_counter() - began)
+        else:
+            process_agent_query('bench-key', agent, question, params)
+
+    per_thread = max(1, requests // concurrency)
+    result = run_threads(operation, concurrency, per_thread)
+    result['stream'] = stream
+    result['mock'] = {**mock_config, 'requests_served': server.RequestHandlerClass.config.requests}
+    if ttfts:
+        result['ttft'] = percentiles(ttfts)
+    server.shutdown()
+    print(f"  {'stream' if stream else 'process'}_agent_query {concurrency:>3} threads  "
+          f"{result['ops_per_sec']:>8} req/s  p95 {result['p95_ms']} ms  errors {result['errors']}")
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print throughput and p95 changes against an earlier results file"""
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'}:")
+    for name, cases in results['database'].items():
+        before = {case['threads']: case for case in baseline.get('database', {}).get(name, [])}
+        for case in cases:
+            old = before.get(case['threads'])
+            if not old:
+                continue
+            print(f"  {name:<18} {case['threads']:>3} threads  "
+                  f"ops/s {case['ops_per_sec'] / old['ops_per_sec'] - 1:+.0%}  "
+                  f"p95 {case['p95_ms'] / old['p95_ms'] - 1:+.0%}")
+    if results.get('llm') and baseline.get('llm'):
+        new, old = results['llm'], baseline['llm']
+        print(f"  {'agent query':<18} {new['threads']:>3} threads  "
+              f"req/s {new['ops_per_sec'] / old['ops_per_sec'] - 1:+.0%}  "
+              f"p95 {new['p95_ms'] / old['p95_ms'] - 1:+.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the database and chat hot paths")
+    parser.add_argument('--agents', type=int, default=1000, help="agents to seed")
+    parser.add_argument('--versions', type=int, default=3, help="prompt versions per agent")
+    parser.add_argument('--params', type=int, default=3, help="parameters per agent")
+    parser.add_argument('--threads', default=DEFAULT_THREADS, help="comma-separated thread counts")
+    parser.add_argument('--read-ops', type=int, default=500, help="reads per thread per case")
+    parser.add_argument('--write-ops', type=int, default=10, help="writes per thread per case")
+    parser.add_argument('--db', help="database to seed and use (default: a temporary file)")
+    parser.add_argument('--llm-requests', type=int, default=200, help="agent queries to send; 0 to skip")
+    parser.add_argument('--llm-concurrency', type=int, default=8, help="threads sending agent queries")
+    parser.add_argument('--stream', action='store_true', help="use stream_agent_query")
+    parser.add_argument('--latency', type=float, default=0.05, help="mock seconds before the first byte")
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help="mock seconds between streamed chunks")
+    parser.add_argument('--words', type=int, default=50, help="mock words per response")
+    parser.add_argument('--output', default='benchmark.json', help="JSON results file")
+    parser.add_argument('--compare', help="earlier JSON results to compare against")
+    parser.add_argument('--seed', type=int, default=1, help="random seed")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    thread_counts = [int(count) for count in args.threads.split(',')]
+    workdir = tempfile.mkdtemp(prefix='agents-bench-')
+    # Keep the caches and metrics of the run out of the working directory;
+    # these modules read their paths at import time
+    os.environ.setdefault('RESPONSE_CACHE_PATH', os.path.join(workdir, 'response_cache.db'))
+    os.environ.setdefault('METRICS_PATH', os.path.join(workdir, 'metrics.db'))
+    from database import Database
+
+    db = Database(args.db or os.path.join(workdir, 'agents.db'))
+    print(f"Seeding {args.agents} agents x {args.versions} versions x {args.params} params")
+    began = time.perf_counter()
+    agent_ids = seed(db, args.agents, args.versions, args.params)
+    seed_seconds = time.perf_counter() - began
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'args': vars(args)
+        },
+        'seed_seconds': round(seed_seconds, 3),
+        'database': bench_database(db, agent_ids, thread_counts, args.read_ops, args.write_ops)
+    }
+    if args.llm_requests:
+        results['llm'] = bench_llm(
+            db, agent_ids, args.llm_requests, args.llm_concurrency, args.stream,
+            {'latency': args.latency, 'chunk_delay': args.chunk_delay, 'words': args.words}
+        )
+    db.close()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
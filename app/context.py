@@ -0,0 +1,92 @@
+import os
+from collections import deque
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional; fall back to an estimate
+    _encoding = None
+
+# Tokens of conversation history sent with each turn (the system prompt and
+# the new user message are not counted against it)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Tokens the rolling summary of older turns may use
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "500"))
+# Characters of each folded turn kept in the summary
+SUMMARY_LINE_CHARS = 200
+# Per-message framing tokens added by the chat format
+MESSAGE_OVERHEAD = 4
+
+
+def count_tokens(text):
+    """Count tokens with tiktoken when installed, else estimate ~4 characters per token"""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+class ConversationContext:
+    """
+    Conversation history for the model, kept within a token budget.
+
+    Each message is counted once when it is appended. The most recent turns
+    are kept verbatim; older ones are folded into a rolling summary, which is
+    itself trimmed oldest-first to SUMMARY_TOKEN_BUDGET. Appending a message
+    costs O(new message) regardless of how long the conversation has run.
+    """
+
+    def __init__(self, budget=CONTEXT_TOKEN_BUDGET, summary_budget=SUMMARY_TOKEN_BUDGET):
+        self.budget = budget
+        self.summary_budget = summary_budget
+        self.turns = deque()  # (message, tokens)
+        self.turn_tokens = 0
+        self.summary = deque()  # (line, tokens)
+        self.summary_tokens = 0
+
+    def append(self, role, content):
+        """Add a message, folding the oldest turns into the summary if over budget"""
+        tokens = count_tokens(content) + MESSAGE_OVERHEAD
+        self.turns.append(({"role": role, "content": content}, tokens))
+        self.turn_tokens += tokens
+
+        # Always keep the latest message, even if it alone exceeds the budget
+        while self.turn_tokens > self.budget and len(self.turns) > 1:
+            message, message_tokens = self.turns.popleft()
+            self.turn_tokens -= message_tokens
+            self._fold(message)
+
+    def _fold(self, message):
+        """Move a message into the summary as a shortened line"""
+        text = " ".join(message["content"].split())
+        if len(text) > SUMMARY_LINE_CHARS:
+            text = text[:SUMMARY_LINE_CHARS].rsplit(" ", 1)[0] + "…"
+        line = f"- {message['role']}: {text}"
+        tokens = count_tokens(line)
+        self.summary.append((line, tokens))
+        self.summary_tokens += tokens
+
+        while self.summary_tokens > self.summary_budget and self.summary:
+            _, line_tokens = self.summary.popleft()
+            self.summary_tokens -= line_tokens
+
+    def messages(self):
+        """Messages to send before the new user input"""
+        messages = []
+        if self.summary:
+            messages.append({
+                "role": "system",
+                "content": "Summary of the earlier conversation:\n" + "\n".join(line for line, _ in self.summary)
+            })
+        messages.extend(message for message, _ in self.turns)
+        return messages
+
+    @property
+    def tokens(self):
+        """Tokens the history currently adds to a request"""
+        return self.turn_tokens + self.summary_tokens
+
+    def clear(self):
+        self.turns.clear()
+        self.summary.clear()
+        self.turn_tokens = 0
+        self.summary_tokens = 0
@@ -1,15 +1,123 @@
 import sqlite3
+import hashlib
 import json
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from models import Agent
+from response_cache import get_response_cache
 
-class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('agents.db', check_same_thread=False)
-        self.cursor = self.conn.cursor()
-        self.create_tables()
-
-    def create_tables(self):
-        # Create agents table with expanded schema
-        self.cursor.execute('''
+DB_PATH = os.getenv("AGENTS_DB_PATH", "agents.db")
+# Seconds a connection waits on a locked database before giving up
+BUSY_TIMEOUT = float(os.getenv("AGENTS_DB_BUSY_TIMEOUT", "5"))
+# Seconds a cached agent catalog is served before checking whether another process changed it
+CATALOG_CHECK_INTERVAL = float(os.getenv("AGENTS_CATALOG_CHECK_INTERVAL", "1"))
+# Idle connections kept open for reuse; busier moments open extra ones that are closed after use
+POOL_SIZE = int(os.getenv("AGENTS_DB_POOL_SIZE", "8"))
+# Prompt texts of at least this many bytes are stored zlib-compressed
+PROMPT_COMPRESS_MIN = int(os.getenv("AGENTS_PROMPT_COMPRESS_MIN", "512"))
+# SQL for the current time to the millisecond; agents.updated_at doubles as
+# the version editors check before saving
+TIMESTAMP_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+# Days a soft-deleted agent is kept before purge_deleted_agents removes it
+PURGE_RETENTION_DAYS = int(os.getenv("AGENTS_PURGE_RETENTION_DAYS", "30"))
+# Agents hard-deleted per transaction, to keep the write lock short
+PURGE_BATCH = 500
+# Free pages released per incremental vacuum step
+VACUUM_STEP_PAGES = 256
+
+
+class ConcurrentUpdateError(Exception):
+    """An agent changed after the editor loaded it; the message is fit to show to the user"""
+
+
+def _as_datetime(value):
+    """A stored or loaded timestamp as a datetime, for comparing updated_at values"""
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+def prompt_hash(prompt):
+    """Content address of a prompt text"""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+def encode_prompt(prompt):
+    """(encoding, content) to store a prompt text as in prompt_blobs"""
+    data = prompt.encode('utf-8')
+    if len(data) >= PROMPT_COMPRESS_MIN:
+        compressed = zlib.compress(data, 9)
+        if len(compressed) < len(data):
+            return 'zlib', compressed
+    return 'text', prompt
+
+
+def decode_prompt(encoding, content):
+    """Text of a prompt_blobs row; registered on every connection as prompt_text()"""
+    if encoding == 'zlib':
+        return zlib.decompress(content).decode('utf-8')
+    return content
+
+
+def _migrate_prompt_blobs(cursor):
+    """Move prompt texts into prompt_blobs and point each agent at its active version"""
+    rows = cursor.execute('''
+    SELECT id, agent_id, prompt_template, version, created_at, is_active
+    FROM agent_prompts
+    WHERE agent_id IN (SELECT id FROM agents)
+    ORDER BY id
+    ''').fetchall()
+    blobs = {prompt_hash(row[2]): row[2] for row in rows}
+    cursor.executemany('''
+    INSERT OR IGNORE INTO prompt_blobs (hash, encoding, content, size) VALUES (?, ?, ?, ?)
+    ''', [
+        (content_hash, *encode_prompt(prompt), len(prompt.encode('utf-8')))
+        for content_hash, prompt in blobs.items()
+    ])
+
+    cursor.execute('ALTER TABLE agents ADD COLUMN active_version INTEGER')
+    cursor.execute('''
+    UPDATE agents SET active_version = (
+        SELECT version FROM agent_prompts
+        WHERE agent_id = agents.id AND is_active = TRUE ORDER BY version DESC LIMIT 1
+    )
+    ''')
+
+    # Rebuild agent_prompts without the text and the is_active flags
+    cursor.execute('DROP TABLE agent_prompts')
+    cursor.execute('''
+    CREATE TABLE agent_prompts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        agent_id INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        content_hash TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (agent_id, version),
+        FOREIGN KEY (agent_id) REFERENCES agents (id),
+        FOREIGN KEY (content_hash) REFERENCES prompt_blobs (hash)
+    )
+    ''')
+    cursor.executemany('''
+    INSERT OR IGNORE INTO agent_prompts (id, agent_id, version, content_hash, created_at)
+    VALUES (?, ?, ?, ?, ?)
+    ''', [
+        (prompt_id, agent_id, version, prompt_hash(prompt), created_at)
+        for prompt_id, agent_id, prompt, version, created_at, _ in rows
+    ])
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_agent_prompts_hash ON agent_prompts (content_hash)')
+
+
+# Schema migrations, applied in order. The index of a migration plus one is the
+# PRAGMA user_version it upgrades the database to; only ever append to this list.
+# A step is a SQL statement or a function called with the migration's cursor.
+MIGRATIONS = [
+    # 1: base schema (existing databases created before migrations start here)
+    [
+        '''
         CREATE TABLE IF NOT EXISTS agents (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
@@ -20,10 +128,8 @@ class Database:
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             is_active BOOLEAN DEFAULT TRUE
         )
-        ''')
-
-        # Create table for agent prompts
-        self.cursor.execute('''
+        ''',
+        '''
         CREATE TABLE IF NOT EXISTS agent_prompts (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             agent_id INTEGER NOT NULL,
@@ -33,10 +139,8 @@ class Database:
             is_active BOOLEAN DEFAULT TRUE,
             FOREIGN KEY (agent_id) REFERENCES agents (id)
         )
-        ''')
-
-        # Create table for agent parameters
-        self.cursor.execute('''
+        ''',
+        '''
         CREATE TABLE IF NOT EXISTS agent_parameters (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             agent_id INTEGER NOT NULL,
@@ -47,10 +151,8 @@ class Database:
             default_value TEXT,
             FOREIGN KEY (agent_id) REFERENCES agents (id)
         )
-        ''')
-
-        # Create table for agent configurations
-        self.cursor.execute('''
+        ''',
+        '''
         CREATE TABLE IF NOT EXISTS agent_configs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             agent_id INTEGER NOT NULL,
@@ -58,17 +160,274 @@ class Database:
             config_value TEXT NOT NULL,
             FOREIGN KEY (agent_id) REFERENCES agents (id)
         )
-        ''')
+        ''',
+    ],
+    # 2: indexes for the agent joins and active-prompt lookups
+    [
+        'CREATE INDEX IF NOT EXISTS idx_agent_prompts_agent_active ON agent_prompts (agent_id, is_active, version)',
+        'CREATE INDEX IF NOT EXISTS idx_agent_parameters_agent ON agent_parameters (agent_id)',
+        'CREATE INDEX IF NOT EXISTS idx_agent_configs_agent ON agent_configs (agent_id)',
+        'CREATE INDEX IF NOT EXISTS idx_agents_active ON agents (id) WHERE is_active = TRUE',
+        'ANALYZE',
+    ],
+    # 3: catalog generation counter, bumped by every agent write
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS catalog_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL
+        )
+        ''',
+        'INSERT OR IGNORE INTO catalog_state (id, generation) VALUES (1, 0)',
+    ],
+    # 4: persistent chat sessions and their append-only messages
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            agent_id INTEGER NOT NULL,
+            title TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (agent_id) REFERENCES agents (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL,
+            agent_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES chat_sessions (id),
+            FOREIGN KEY (agent_id) REFERENCES agents (id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_chat_sessions_agent ON chat_sessions (agent_id, updated_at)',
+        'CREATE INDEX IF NOT EXISTS idx_chat_messages_session ON chat_messages (session_id, id)',
+        'CREATE INDEX IF NOT EXISTS idx_chat_messages_agent ON chat_messages (agent_id)',
+    ],
+    # 5: full-text search over agents and their active prompt (rowid = agents.id)
+    [
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS agents_fts USING fts5(
+            name, expertise, description, prompt,
+            prefix = '2 3'
+        )
+        ''',
+        '''
+        INSERT INTO agents_fts (rowid, name, expertise, description, prompt)
+        SELECT a.id, a.name, a.expertise, a.description,
+            (SELECT prompt_template FROM agent_prompts
+             WHERE agent_id = a.id AND is_active = TRUE ORDER BY version DESC LIMIT 1)
+        FROM agents a
+        WHERE a.is_active = TRUE
+        ''',
+    ],
+    # 6: content-addressed prompt versions, stored once per distinct text;
+    # agents.active_version points at the version in use
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS prompt_blobs (
+            hash TEXT PRIMARY KEY,
+            encoding TEXT NOT NULL,
+            content BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        _migrate_prompt_blobs,
+    ],
+]
 
-        self.conn.commit()
+# Tables whose rows belong to an agent through their agent_id column
+AGENT_CHILD_TABLES = ('agent_prompts', 'agent_parameters', 'agent_configs', 'chat_messages', 'chat_sessions')
 
-    def create_agent(self, agent_data):
+# Relative weight of each agents_fts column in search ranking
+SEARCH_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+# SQL expression for each agent field that can be fetched on its own (agents aliased as a)
+AGENT_FIELDS = {
+    'id': 'a.id',
+    'name': 'a.name',
+    'expertise': 'a.expertise',
+    'description': 'a.description',
+    'agent_type': 'a.agent_type',
+    'created_at': 'a.created_at',
+    'updated_at': 'a.updated_at',
+    'prompt': '''(SELECT prompt_text(b.encoding, b.content)
+        FROM agent_prompts p JOIN prompt_blobs b ON b.hash = p.content_hash
+        WHERE p.agent_id = a.id AND p.version = a.active_version)''',
+    'prompt_version': 'a.active_version',
+    'parameters': '''(SELECT json_group_array(json_array(param_name, param_type, is_required, description, default_value))
+        FROM (SELECT * FROM agent_parameters WHERE agent_id = a.id ORDER BY id))''',
+    'configs': '''(SELECT json_group_object(config_key, json(config_value))
+        FROM agent_configs WHERE agent_id = a.id)''',
+}
+
+
+class Database:
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        # Configured connections waiting to be reused, most recently used first
+        self._pool = queue.LifoQueue(maxsize=POOL_SIZE)
+        # In-process agent catalog, shared by every session using this instance:
+        # (agents, {agent id: agent}), or None when it needs reloading
+        self._catalog = None
+        self._catalog_generation = None
+        self._catalog_checked_at = 0.0
+        self._catalog_lock = threading.Lock()
+        self.migrate()
+
+    def _open(self):
+        """Open and configure a new connection"""
+        # isolation_level=None: autocommit reads, explicit BEGIN for writes
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        # Takes effect on a new database; compact() converts existing ones
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}')
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.create_function('prompt_text', 2, decode_prompt, deterministic=True)
+        return conn
+
+    @contextmanager
+    def _checkout(self):
+        """
+        Borrow a connection from the pool for the duration of the block.
+
+        Streamlit runs every rerun on a new thread, so connections are not tied
+        to threads: an idle one is reused, or a new one opened when none is
+        free. On return it goes back to the pool, or is closed if POOL_SIZE
+        connections are already idle.
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._open()
         try:
-            # Start a transaction
-            self.conn.execute('BEGIN')
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def cursor(self):
+        """Yield a cursor on a pooled connection for reads"""
+        with self._checkout() as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def transaction(self):
+        """Yield a cursor inside a write transaction, committing on success"""
+        with self._checkout() as conn:
+            cursor = conn.cursor()
+            # Take the write lock up front so the transaction can't fail half way on upgrade
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                yield cursor
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            finally:
+                cursor.close()
 
+    def migrate(self):
+        """Bring the schema up to date, applying each pending migration in its own transaction"""
+        with self.cursor() as cursor:
+            current = cursor.execute('PRAGMA user_version').fetchone()[0]
+
+        for version, statements in enumerate(MIGRATIONS[current:], start=current + 1):
+            with self.transaction() as cursor:
+                # Re-check under the write lock in case another process migrated first
+                if cursor.execute('PRAGMA user_version').fetchone()[0] >= version:
+                    continue
+                for statement in statements:
+                    if callable(statement):
+                        statement(cursor)
+                    else:
+                        cursor.execute(statement)
+                cursor.execute(f'PRAGMA user_version = {version}')
+
+    def _bump_generation(self, cursor):
+        """Mark the agent catalog as changed; call inside the writing transaction"""
+        cursor.execute('UPDATE catalog_state SET generation = generation + 1 WHERE id = 1')
+
+    def _index_agent(self, cursor, agent_id):
+        """Refresh an agent's search index entry; call inside the writing transaction"""
+        cursor.execute('DELETE FROM agents_fts WHERE rowid = ?', (agent_id,))
+        cursor.execute(f'''
+        INSERT INTO agents_fts (rowid, name, expertise, description, prompt)
+        SELECT a.id, a.name, a.expertise, a.description, {AGENT_FIELDS['prompt']}
+        FROM agents a
+        WHERE a.id = ? AND a.is_active = TRUE
+        ''', (agent_id,))
+
+    def _store_blobs(self, cursor, prompts):
+        """Store the prompt texts not stored yet; returns their hashes in order"""
+        hashes = [prompt_hash(prompt) for prompt in prompts]
+        cursor.executemany('''
+        INSERT OR IGNORE INTO prompt_blobs (hash, encoding, content, size)
+        VALUES (?, ?, ?, ?)
+        ''', [
+            (content_hash, *encode_prompt(prompt), len(prompt.encode('utf-8')))
+            for content_hash, prompt in dict(zip(hashes, prompts)).items()
+        ])
+        return hashes
+
+    def _store_prompt(self, cursor, agent_id, prompt):
+        """
+        Make a prompt text the agent's active prompt; call inside the writing transaction.
+
+        Saving the text already active changes nothing; any other text becomes
+        a new version. Returns (active version, whether it changed).
+        """
+        content_hash = prompt_hash(prompt)
+        row = cursor.execute('''
+        SELECT a.active_version, p.content_hash FROM agents a
+        LEFT JOIN agent_prompts p ON p.agent_id = a.id AND p.version = a.active_version
+        WHERE a.id = ?
+        ''', (agent_id,)).fetchone()
+        if row and row[1] == content_hash:
+            return row[0], False
+
+        self._store_blobs(cursor, [prompt])
+        cursor.execute('''
+        INSERT INTO agent_prompts (agent_id, version, content_hash)
+        SELECT ?, COALESCE(MAX(version), 0) + 1, ?
+        FROM agent_prompts WHERE agent_id = ?
+        ''', (agent_id, content_hash, agent_id))
+        version = cursor.execute(
+            'SELECT version FROM agent_prompts WHERE id = ?', (cursor.lastrowid,)
+        ).fetchone()[0]
+        cursor.execute('UPDATE agents SET active_version = ? WHERE id = ?', (version, agent_id))
+        return version, True
+
+    def invalidate_catalog(self):
+        """Drop this process's cached agent catalog"""
+        with self._catalog_lock:
+            self._catalog = None
+
+    def create_agent(self, agent_data):
+        with self.transaction() as cursor:
             # Insert agent basic information
-            self.cursor.execute('''
+            cursor.execute('''
             INSERT INTO agents (name, expertise, description, agent_type)
             VALUES (?, ?, ?, ?)
             ''', (
@@ -77,19 +436,16 @@ class Database:
                 agent_data['description'],
                 agent_data['agent_type']
             ))
-            agent_id = self.cursor.lastrowid
+            agent_id = cursor.lastrowid
 
             # Insert agent prompt
-            self.cursor.execute('''
-            INSERT INTO agent_prompts (agent_id, prompt_template)
-            VALUES (?, ?)
-            ''', (agent_id, agent_data['prompt']))
+            self._store_prompt(cursor, agent_id, agent_data['prompt'])
 
             # Insert agent parameters
             params = agent_data['required_params'].split(',')
             for param in params:
                 param = param.strip()
-                self.cursor.execute('''
+                cursor.execute('''
                 INSERT INTO agent_parameters (agent_id, param_name, param_type, is_required)
                 VALUES (?, ?, ?, ?)
                 ''', (agent_id, param, 'string', True))
@@ -97,134 +453,628 @@ class Database:
             # Insert any additional configurations
             if 'configs' in agent_data:
                 for key, value in agent_data['configs'].items():
-                    self.cursor.execute('''
+                    cursor.execute('''
                     INSERT INTO agent_configs (agent_id, config_key, config_value)
                     VALUES (?, ?, ?)
                     ''', (agent_id, key, json.dumps(value)))
 
-            # Commit the transaction
-            self.conn.commit()
-            return agent_id
+            self._index_agent(cursor, agent_id)
+            self._bump_generation(cursor)
 
-        except Exception as e:
-            self.conn.rollback()
-            raise e
+        self.invalidate_catalog()
+        return agent_id
 
     def get_agents(self):
-        """Get all active agents with their prompts and parameters"""
-        self.cursor.execute('''
-        SELECT 
-            a.id,
-            a.name,
-            a.expertise,
-            a.description,
-            a.agent_type,
-            ap.prompt_template,
-            GROUP_CONCAT(param.param_name) as parameters
+        """
+        Get all active agents, as Agent objects, with their prompts and parameters.
+
+        Served from the in-process catalog. Local writes invalidate it directly;
+        writes from other processes are picked up through the generation
+        counter, checked at most every CATALOG_CHECK_INTERVAL seconds.
+        """
+        return self._current_catalog()[0]
+
+    def _current_catalog(self):
+        """Return the (agents, index) catalog pair, reloading it if stale"""
+        catalog = self._catalog
+        if catalog is not None and time.monotonic() - self._catalog_checked_at < CATALOG_CHECK_INTERVAL:
+            return catalog
+
+        with self._catalog_lock:
+            with self.cursor() as cursor:
+                generation = cursor.execute(
+                    'SELECT generation FROM catalog_state WHERE id = 1'
+                ).fetchone()[0]
+                if self._catalog is None or generation != self._catalog_generation:
+                    agents = self._load_catalog(cursor)
+                    self._catalog = (agents, {agent.id: agent for agent in agents})
+                    self._catalog_generation = generation
+            self._catalog_checked_at = time.monotonic()
+            return self._catalog
+
+    def _load_catalog(self, cursor):
+        """Run the full catalog query, building every active Agent in one pass"""
+        cursor.execute(f'''
+        SELECT {', '.join(AGENT_FIELDS[column] for column in Agent.COLUMNS)}
         FROM agents a
-        LEFT JOIN agent_prompts ap ON ap.agent_id = a.id AND ap.is_active = TRUE
-        LEFT JOIN agent_parameters param ON param.agent_id = a.id
         WHERE a.is_active = TRUE
-        GROUP BY a.id
+        ORDER BY a.id
         ''')
-        return self.cursor.fetchall()
+        return Agent.from_db_rows(cursor)
+
+    def get_agents_page(self, after_id=None, limit=20):
+        """
+        Get one page of active agents ordered by id, without their prompts.
+
+        Pages are keyed on the last id of the previous page, so each page is
+        an index range scan whatever its position. Prompt bodies are left as
+        None; load them with get_agent_fields when they are shown.
+        """
+        columns = ', '.join(
+            'NULL' if column == 'prompt' else AGENT_FIELDS[column]
+            for column in Agent.COLUMNS
+        )
+        with self.cursor() as cursor:
+            cursor.execute(f'''
+            SELECT {columns}
+            FROM agents a
+            WHERE a.is_active = TRUE AND a.id > ?
+            ORDER BY a.id
+            LIMIT ?
+            ''', (after_id or 0, limit))
+            return Agent.from_db_rows(cursor)
 
     def get_agent_details(self, agent_id):
-        """Get detailed information about a specific agent"""
-        # Get basic agent info
-        self.cursor.execute('''
-        SELECT * FROM agents WHERE id = ? AND is_active = TRUE
-        ''', (agent_id,))
-        agent = self.cursor.fetchone()
+        """
+        Get a specific active agent, fully hydrated, or None.
+
+        The catalog already holds each agent's prompt, parameters and decoded
+        configs, so this is a dictionary lookup.
+        """
+        return self._current_catalog()[1].get(agent_id)
 
-        if not agent:
+    def get_agent_fields(self, agent_id, fields):
+        """
+        Get only the requested fields of an active agent as a dict.
+
+        Fields are the keys of AGENT_FIELDS. Answered from the catalog when it
+        is loaded, otherwise with a query that selects just those columns.
+        """
+        unknown = set(fields) - set(AGENT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown agent fields: {', '.join(sorted(unknown))}")
+
+        if self._catalog is not None:
+            agent = self.get_agent_details(agent_id)
+            return {field: getattr(agent, field) for field in fields} if agent else None
+
+        with self.cursor() as cursor:
+            cursor.execute(f'''
+            SELECT {', '.join(AGENT_FIELDS[field] for field in fields)}
+            FROM agents a
+            WHERE a.id = ? AND a.is_active = TRUE
+            ''', (agent_id,))
+            row = cursor.fetchone()
+
+        if not row:
             return None
 
-        # Get current prompt
-        self.cursor.execute('''
-        SELECT prompt_template FROM agent_prompts 
-        WHERE agent_id = ? AND is_active = TRUE 
-        ORDER BY version DESC LIMIT 1
-        ''', (agent_id,))
-        prompt = self.cursor.fetchone()
+        values = dict(zip(fields, row))
+        if 'parameters' in values:
+            values['parameters'] = tuple(param[0] for param in json.loads(values['parameters']))
+        if 'configs' in values:
+            values['configs'] = json.loads(values['configs'])
+        for field in ('created_at', 'updated_at'):
+            if values.get(field):
+                values[field] = datetime.fromisoformat(values[field])
+        return values
 
-        # Get parameters
-        self.cursor.execute('''
-        SELECT param_name, param_type, is_required, description, default_value 
-        FROM agent_parameters WHERE agent_id = ?
-        ''', (agent_id,))
-        parameters = self.cursor.fetchall()
+    def update_agent(self, agent_id, agent_data, expected_updated_at=None):
+        """
+        Update an agent from create_agent-style data, writing only what changed.
 
-        # Get configurations
-        self.cursor.execute('''
-        SELECT config_key, config_value FROM agent_configs WHERE agent_id = ?
-        ''', (agent_id,))
-        configs = self.cursor.fetchall()
+        Columns, parameters and configs are diffed against the stored agent
+        and only the differing rows are written; the prompt gets a new version
+        only if its text changed. configs are left alone unless agent_data has
+        them. Pass the updated_at the editor started from to refuse
+        overwriting someone else's save with ConcurrentUpdateError. Returns
+        whether anything changed.
+        """
+        params = list(dict.fromkeys(param.strip() for param in agent_data['required_params'].split(',')))
 
-        return {
-            'agent': agent,
-            'prompt': prompt[0] if prompt else None,
-            'parameters': parameters,
-            'configs': {k: json.loads(v) for k, v in configs} if configs else {}
-        }
+        with self.transaction() as cursor:
+            row = cursor.execute('''
+            SELECT name, expertise, description, agent_type, updated_at
+            FROM agents WHERE id = ? AND is_active = TRUE
+            ''', (agent_id,)).fetchone()
+            if row is None:
+                raise ConcurrentUpdateError("This agent has been deleted.")
+            if expected_updated_at is not None and _as_datetime(row[4]) != _as_datetime(expected_updated_at):
+                raise ConcurrentUpdateError("This agent was changed by someone else after you opened it.")
 
-    def update_agent(self, agent_id, agent_data):
-        try:
-            self.conn.execute('BEGIN')
+            changes = {
+                column: agent_data[column]
+                for column, stored in zip(('name', 'expertise', 'description', 'agent_type'), row)
+                if agent_data[column] != stored
+            }
 
-            # Update basic agent information
-            self.cursor.execute('''
-            UPDATE agents 
-            SET name=?, expertise=?, description=?, agent_type=?, updated_at=CURRENT_TIMESTAMP
-            WHERE id=?
-            ''', (
-                agent_data['name'],
-                agent_data['expertise'],
-                agent_data['description'],
-                agent_data['agent_type'],
-                agent_id
-            ))
+            # Prompt - create a new version if it changed
+            _, prompt_changed = self._store_prompt(cursor, agent_id, agent_data['prompt'])
+
+            # Parameters - drop removed ones and append new ones, rewriting
+            # them all only when the order changed
+            stored_params = [name for (name,) in cursor.execute(
+                'SELECT param_name FROM agent_parameters WHERE agent_id = ? ORDER BY id', (agent_id,)
+            )]
+            removed = [param for param in stored_params if param not in params]
+            added = [param for param in params if param not in stored_params]
+            if [param for param in stored_params if param in params] + added != params:
+                removed, added = stored_params, params
+            cursor.executemany(
+                'DELETE FROM agent_parameters WHERE agent_id = ? AND param_name = ?',
+                [(agent_id, param) for param in dict.fromkeys(removed)]
+            )
+            cursor.executemany('''
+            INSERT INTO agent_parameters (agent_id, param_name, param_type, is_required)
+            VALUES (?, ?, ?, ?)
+            ''', [(agent_id, param, 'string', True) for param in added])
+
+            # Configs - replace only the keys whose values differ
+            stale, fresh = [], []
+            if 'configs' in agent_data:
+                configs = agent_data['configs']
+                stored_configs = {
+                    key: json.loads(value) for key, value in cursor.execute(
+                        'SELECT config_key, config_value FROM agent_configs WHERE agent_id = ?', (agent_id,)
+                    )
+                }
+                stale = [key for key, value in stored_configs.items()
+                         if key not in configs or configs[key] != value]
+                fresh = [key for key, value in configs.items()
+                         if key not in stored_configs or stored_configs[key] != value]
+                cursor.executemany(
+                    'DELETE FROM agent_configs WHERE agent_id = ? AND config_key = ?',
+                    [(agent_id, key) for key in stale]
+                )
+                cursor.executemany('''
+                INSERT INTO agent_configs (agent_id, config_key, config_value)
+                VALUES (?, ?, ?)
+                ''', [(agent_id, key, json.dumps(configs[key])) for key in fresh])
 
-            # Update prompt - create new version
-            self.cursor.execute('''
-            UPDATE agent_prompts SET is_active = FALSE 
-            WHERE agent_id = ? AND is_active = TRUE
+            if not (changes or prompt_changed or removed or added or stale or fresh):
+                return False
+
+            cursor.execute(f'''
+            UPDATE agents SET {''.join(f'{column} = ?, ' for column in changes)}updated_at = {TIMESTAMP_NOW}
+            WHERE id = ?
+            ''', (*changes.values(), agent_id))
+            if prompt_changed or changes.keys() & {'name', 'expertise', 'description'}:
+                self._index_agent(cursor, agent_id)
+            self._bump_generation(cursor)
+
+        # Cached responses are keyed on the compiled prompt, so those of the
+        # old version simply stop matching and age out
+        self.invalidate_catalog()
+        return True
+
+    def get_prompt_versions(self, agent_id):
+        """
+        Prompt history of an agent, newest first, as
+        (version, created_at, content_hash, size, is_active) rows.
+        """
+        with self.cursor() as cursor:
+            cursor.execute('''
+            SELECT p.version, p.created_at, p.content_hash, b.size, p.version = a.active_version
+            FROM agent_prompts p
+            JOIN prompt_blobs b ON b.hash = p.content_hash
+            JOIN agents a ON a.id = p.agent_id
+            WHERE p.agent_id = ?
+            ORDER BY p.version DESC
             ''', (agent_id,))
+            return [
+                (version, created_at, content_hash, size, bool(is_active))
+                for version, created_at, content_hash, size, is_active in cursor.fetchall()
+            ]
 
-            self.cursor.execute('''
-            INSERT INTO agent_prompts (agent_id, prompt_template, version)
-            SELECT ?, ?, COALESCE(MAX(version), 0) + 1
-            FROM agent_prompts WHERE agent_id = ?
-            ''', (agent_id, agent_data['prompt'], agent_id))
+    def get_prompt_version(self, agent_id, version):
+        """Text of one of an agent's prompt versions, or None"""
+        with self.cursor() as cursor:
+            row = cursor.execute('''
+            SELECT prompt_text(b.encoding, b.content)
+            FROM agent_prompts p JOIN prompt_blobs b ON b.hash = p.content_hash
+            WHERE p.agent_id = ? AND p.version = ?
+            ''', (agent_id, version)).fetchone()
+        return row[0] if row else None
 
-            # Update parameters
-            self.cursor.execute('DELETE FROM agent_parameters WHERE agent_id = ?', (agent_id,))
-            params = agent_data['required_params'].split(',')
-            for param in params:
-                param = param.strip()
-                self.cursor.execute('''
-                INSERT INTO agent_parameters (agent_id, param_name, param_type, is_required)
-                VALUES (?, ?, ?, ?)
-                ''', (agent_id, param, 'string', True))
+    def activate_prompt_version(self, agent_id, version):
+        """
+        Make an earlier (or later) prompt version the active one.
 
-            self.conn.commit()
+        Only the agent's version pointer moves; no prompt rows are written.
+        Cached responses and compiled prompts are keyed on the version and the
+        agent's other fields, so those made for the restored version are used
+        again if nothing else changed since. Returns False if the agent has
+        been deleted or has no such version.
+        """
+        with self.transaction() as cursor:
+            exists = cursor.execute(
+                'SELECT 1 FROM agent_prompts WHERE agent_id = ? AND version = ?',
+                (agent_id, version)
+            ).fetchone()
+            if not exists:
+                return False
+            cursor.execute(f'''
+            UPDATE agents SET active_version = ?, updated_at = {TIMESTAMP_NOW}
+            WHERE id = ? AND is_active = TRUE
+            ''', (version, agent_id))
+            if cursor.rowcount == 0:
+                # The agent has been deleted
+                return False
+            self._index_agent(cursor, agent_id)
+            self._bump_generation(cursor)
 
-        except Exception as e:
-            self.conn.rollback()
-            raise e
+        self.invalidate_catalog()
+        return True
 
     def delete_agent(self, agent_id):
-        """Soft delete an agent"""
+        """
+        Soft delete an agent.
+
+        The agent is dropped from the loaded catalog in place rather than
+        invalidating it, unless another writer changed the catalog meanwhile.
+        """
         try:
-            self.cursor.execute('''
-            UPDATE agents SET is_active = FALSE, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-            ''', (agent_id,))
-            self.conn.commit()
+            with self.transaction() as cursor:
+                cursor.execute(f'''
+                UPDATE agents SET is_active = FALSE, updated_at = {TIMESTAMP_NOW}
+                WHERE id = ?
+                ''', (agent_id,))
+                self._index_agent(cursor, agent_id)
+                self._bump_generation(cursor)
+                generation = cursor.execute(
+                    'SELECT generation FROM catalog_state WHERE id = 1'
+                ).fetchone()[0]
+
+            with self._catalog_lock:
+                if self._catalog is not None and generation == self._catalog_generation + 1:
+                    agents, index = self._catalog
+                    index = dict(index)
+                    index.pop(agent_id, None)
+                    self._catalog = (tuple(agent for agent in agents if agent.id != agent_id), index)
+                    self._catalog_generation = generation
+                else:
+                    self._catalog = None
             return True
         except Exception as e:
             print(f"Error deleting agent: {e}")
             return False
 
-    def __del__(self):
-        self.conn.close()
\ No newline at end of file
+    def _purge_agents(self, cursor, agent_ids):
+        """Hard delete agents with all their rows; call inside the writing transaction"""
+        rows = [(agent_id,) for agent_id in agent_ids]
+        for table in AGENT_CHILD_TABLES:
+            cursor.executemany(f'DELETE FROM {table} WHERE agent_id = ?', rows)
+        cursor.executemany('DELETE FROM agents_fts WHERE rowid = ?', rows)
+        cursor.executemany('DELETE FROM agents WHERE id = ?', rows)
+        if rows:
+            # Prompt texts no remaining version uses
+            cursor.execute('''
+            DELETE FROM prompt_blobs
+            WHERE hash NOT IN (SELECT content_hash FROM agent_prompts)
+            ''')
+
+    def purge_deleted_agents(self, retention_days=PURGE_RETENTION_DAYS):
+        """
+        Hard delete agents soft-deleted more than retention_days ago.
+
+        Each agent goes with its prompts, parameters, configs, chats and cached
+        responses, a batch of PURGE_BATCH agents per transaction so the app
+        keeps writing in between. Rows left behind by agents deleted outright
+        are removed too. Returns (agents purged, orphaned rows removed).
+        """
+        purged = 0
+        cache = get_response_cache()
+        while True:
+            with self.transaction() as cursor:
+                agent_ids = [agent_id for (agent_id,) in cursor.execute(f'''
+                SELECT id FROM agents
+                WHERE is_active = FALSE AND updated_at < datetime('now', ?)
+                LIMIT {PURGE_BATCH}
+                ''', (f'-{retention_days} days',))]
+                self._purge_agents(cursor, agent_ids)
+            for agent_id in agent_ids:
+                cache.invalidate_agent(agent_id)
+            purged += len(agent_ids)
+            if len(agent_ids) < PURGE_BATCH:
+                break
+
+        with self.transaction() as cursor:
+            orphans = 0
+            for table in AGENT_CHILD_TABLES:
+                orphans += cursor.execute(
+                    f'DELETE FROM {table} WHERE agent_id NOT IN (SELECT id FROM agents)'
+                ).rowcount
+            cursor.execute('''
+            DELETE FROM agents_fts
+            WHERE rowid NOT IN (SELECT id FROM agents WHERE is_active = TRUE)
+            ''')
+            cursor.execute('''
+            DELETE FROM prompt_blobs
+            WHERE hash NOT IN (SELECT content_hash FROM agent_prompts)
+            ''')
+        return purged, orphans
+
+    def compact(self, step_pages=VACUUM_STEP_PAGES):
+        """
+        Refresh query planner statistics and give free pages back to the filesystem.
+
+        The search index is merged and ANALYZE run first, then free pages are
+        released a few at a time with incremental vacuum, each step its own
+        short write, so it can run while the app is live. A database created
+        before incremental auto-vacuum was enabled is converted first with one
+        full VACUUM. Returns (bytes before, bytes after).
+        """
+        with self._checkout() as conn:
+            def size():
+                return (conn.execute('PRAGMA page_count').fetchone()[0]
+                        * conn.execute('PRAGMA page_size').fetchone()[0])
+
+            before = size()
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                # Switching auto_vacuum mode takes a rebuild of the whole file
+                conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                conn.execute('VACUUM')
+
+            # Merge the search index segments and refresh statistics cheaply
+            # first, so the pages they free are released below
+            with self.transaction() as cursor:
+                cursor.execute("INSERT INTO agents_fts (agents_fts) VALUES ('optimize')")
+            conn.execute('PRAGMA analysis_limit=1000')
+            conn.execute('ANALYZE')
+
+            free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            while free:
+                conn.execute(f'PRAGMA incremental_vacuum({step_pages})').fetchall()
+                remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                if remaining >= free:
+                    break
+                free = remaining
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            return before, size()
+
+    def import_agents(self, records, replace=False):
+        """
+        Load many agents in one transaction, matching existing agents by name.
+
+        Records use the create_agent format. An active agent with the same name
+        is updated in place, getting a new prompt version only if its prompt
+        changed; other records create agents. With replace=True every agent not
+        in the import is removed along with its prompts, parameters, configs
+        and chats. Returns (created, updated, removed) counts.
+        """
+        # Last record wins when a name appears twice
+        records = {record['name']: record for record in records}
+
+        with self.transaction() as cursor:
+            existing = dict(cursor.execute(
+                'SELECT name, MAX(id) FROM agents WHERE is_active = TRUE GROUP BY name'
+            ).fetchall())
+            active_prompts = dict(cursor.execute('''
+            SELECT a.id, p.content_hash FROM agents a
+            JOIN agent_prompts p ON p.agent_id = a.id AND p.version = a.active_version
+            WHERE a.is_active = TRUE
+            ''').fetchall())
+
+            removed = []
+            if replace:
+                kept = {existing[name] for name in records if name in existing}
+                removed = [agent_id for (agent_id,) in cursor.execute('SELECT id FROM agents').fetchall()
+                           if agent_id not in kept]
+                self._purge_agents(cursor, removed)
+                existing = {name: agent_id for name, agent_id in existing.items() if agent_id in kept}
+
+            new = [record for name, record in records.items() if name not in existing]
+            updated = {existing[name]: record for name, record in records.items() if name in existing}
+
+            # New agents: insert the rows in bulk, then read back their ids
+            last_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM agents').fetchone()[0]
+            cursor.executemany('''
+            INSERT INTO agents (name, expertise, description, agent_type, active_version)
+            VALUES (?, ?, ?, ?, 1)
+            ''', [
+                (r['name'], r['expertise'], r['description'], r['agent_type'])
+                for r in new
+            ])
+            created = dict(cursor.execute(
+                'SELECT name, id FROM agents WHERE id > ?', (last_id,)
+            ).fetchall())
+            hashes = dict(zip(records, self._store_blobs(cursor, [r['prompt'] for r in records.values()])))
+            cursor.executemany('''
+            INSERT INTO agent_prompts (agent_id, version, content_hash)
+            VALUES (?, 1, ?)
+            ''', [(created[r['name']], hashes[r['name']]) for r in new])
+
+            # Existing agents: update in place, versioning only changed prompts
+            cursor.executemany(f'''
+            UPDATE agents
+            SET expertise=?, description=?, agent_type=?, updated_at={TIMESTAMP_NOW}
+            WHERE id=?
+            ''', [
+                (r['expertise'], r['description'], r['agent_type'], agent_id)
+                for agent_id, r in updated.items()
+            ])
+            reprompted = [
+                (agent_id, hashes[r['name']]) for agent_id, r in updated.items()
+                if active_prompts.get(agent_id) != hashes[r['name']]
+            ]
+            cursor.executemany('''
+            INSERT INTO agent_prompts (agent_id, version, content_hash)
+            SELECT ?, COALESCE(MAX(version), 0) + 1, ?
+            FROM agent_prompts WHERE agent_id = ?
+            ''', [(agent_id, content_hash, agent_id) for agent_id, content_hash in reprompted])
+            cursor.executemany('''
+            UPDATE agents
+            SET active_version = (SELECT MAX(version) FROM agent_prompts WHERE agent_id = agents.id)
+            WHERE id = ?
+            ''', [(agent_id,) for agent_id, _ in reprompted])
+            cursor.executemany('DELETE FROM agent_parameters WHERE agent_id = ?', [(i,) for i in updated])
+            cursor.executemany('DELETE FROM agent_configs WHERE agent_id = ?', [(i,) for i in updated])
+            cursor.executemany('DELETE FROM agents_fts WHERE rowid = ?', [(i,) for i in updated])
+
+            # Parameters, configs and search entries for every imported agent
+            imported = [(created[r['name']], r) for r in new] + list(updated.items())
+            cursor.executemany('''
+            INSERT INTO agent_parameters (agent_id, param_name, param_type, is_required)
+            VALUES (?, ?, ?, ?)
+            ''', [
+                (agent_id, param.strip(), 'string', True)
+                for agent_id, r in imported
+                for param in r['required_params'].split(',')
+            ])
+            cursor.executemany('''
+            INSERT INTO agent_configs (agent_id, config_key, config_value)
+            VALUES (?, ?, ?)
+            ''', [
+                (agent_id, key, json.dumps(value))
+                for agent_id, r in imported
+                for key, value in (r.get('configs') or {}).items()
+            ])
+            cursor.executemany('''
+            INSERT INTO agents_fts (rowid, name, expertise, description, prompt)
+            VALUES (?, ?, ?, ?, ?)
+            ''', [
+                (agent_id, r['name'], r['expertise'], r['description'], r['prompt'])
+                for agent_id, r in imported
+            ])
+
+            self._bump_generation(cursor)
+
+        self.invalidate_catalog()
+
+        cache = get_response_cache()
+        for agent_id in removed:
+            cache.invalidate_agent(agent_id)
+
+        return len(new), len(updated), len(removed)
+
+    def iter_export_agents(self):
+        """
+        Yield every active agent as a record in the create_agent format.
+
+        Rows are streamed from the cursor, so exporting a large library never
+        holds it all in memory.
+        """
+        fields = ('name', 'expertise', 'description', 'agent_type', 'prompt', 'parameters', 'configs')
+        with self.cursor() as cursor:
+            cursor.execute(f'''
+            SELECT {', '.join(AGENT_FIELDS[field] for field in fields)}
+            FROM agents a
+            WHERE a.is_active = TRUE
+            ORDER BY a.id
+            ''')
+            for name, expertise, description, agent_type, prompt, parameters, configs in cursor:
+                record = {
+                    'name': name,
+                    'expertise': expertise,
+                    'description': description,
+                    'agent_type': agent_type,
+                    'prompt': prompt,
+                    'required_params': ','.join(param[0] for param in json.loads(parameters))
+                }
+                configs = json.loads(configs)
+                if configs:
+                    record['configs'] = configs
+                yield record
+
+    def search_agents(self, query, limit=20, offset=0):
+        """
+        Search active agents by name, expertise, description and prompt.
+
+        Every word in the query must match the start of a word in the agent,
+        so partially typed words match. Results are Agents ranked by bm25
+        with name and expertise matches weighted highest.
+        """
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return []
+        match = ' '.join(f'"{term}"*' for term in terms)
+
+        with self.cursor() as cursor:
+            cursor.execute(f'''
+            SELECT agents_fts.rowid FROM agents_fts
+            JOIN agents a ON a.id = agents_fts.rowid AND a.is_active = TRUE
+            WHERE agents_fts MATCH ?
+            ORDER BY bm25(agents_fts, {', '.join(map(str, SEARCH_WEIGHTS))})
+            LIMIT ? OFFSET ?
+            ''', (match, limit, offset))
+            ids = [row[0] for row in cursor.fetchall()]
+
+        index = self._current_catalog()[1]
+        return [index[agent_id] for agent_id in ids if agent_id in index]
+
+    def create_chat_session(self, agent_id, title=None):
+        """Start a new chat session with an agent"""
+        with self.transaction() as cursor:
+            cursor.execute('''
+            INSERT INTO chat_sessions (agent_id, title) VALUES (?, ?)
+            ''', (agent_id, title))
+            return cursor.lastrowid
+
+    def get_chat_sessions(self, agent_id, limit=20):
+        """Most recently used chat sessions for an agent: (id, title, updated_at) rows"""
+        with self.cursor() as cursor:
+            cursor.execute('''
+            SELECT id, title, updated_at FROM chat_sessions
+            WHERE agent_id = ?
+            ORDER BY updated_at DESC, id DESC
+            LIMIT ?
+            ''', (agent_id, limit))
+            return cursor.fetchall()
+
+    def add_chat_messages(self, session_id, agent_id, messages):
+        """
+        Append (role, content) messages to a session.
+
+        Returns the new message rows as (id, role, content). The first user
+        message also becomes the session title.
+        """
+        rows = []
+        with self.transaction() as cursor:
+            for role, content in messages:
+                cursor.execute('''
+                INSERT INTO chat_messages (session_id, agent_id, role, content)
+                VALUES (?, ?, ?, ?)
+                ''', (session_id, agent_id, role, content))
+                rows.append((cursor.lastrowid, role, content))
+
+            title = next((content for role, content in messages if role == 'user'), None)
+            cursor.execute('''
+            UPDATE chat_sessions
+            SET updated_at = CURRENT_TIMESTAMP, title = COALESCE(title, ?)
+            WHERE id = ?
+            ''', (title[:80] if title else None, session_id))
+        return rows
+
+    def get_chat_messages(self, session_id, limit=20, before_id=None):
+        """
+        Get up to `limit` messages of a session older than before_id (newest
+        first when before_id is None), returned oldest first as (id, role, content).
+        """
+        with self.cursor() as cursor:
+            cursor.execute('''
+            SELECT id, role, content FROM chat_messages
+            WHERE session_id = ? AND id < ?
+            ORDER BY id DESC
+            LIMIT ?
+            ''', (session_id, before_id if before_id is not None else 2 ** 63 - 1, limit))
+            rows = cursor.fetchall()
+        rows.reverse()
+        return rows
+
+    def close(self):
+        """Close every idle pooled connection"""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
@@ -269,21 +269,13 @@ Key Insights for Development"""
         }
     ]
 
-    # First, clear existing agents (optional, remove if you want to keep existing agents)
+    # Replace the library with these agents in one transaction; agents that
+    # already exist keep their id (and chat history) and are updated in place
     try:
-        db.cursor.execute("DELETE FROM agents")
-        db.conn.commit()
-        print("Cleared existing agents")
+        created, updated, removed = db.import_agents(agents, replace=True)
+        print(f"Agents loaded: {created} created, {updated} updated, {removed} removed")
     except Exception as e:
-        print(f"Error clearing existing agents: {e}")
-
-    # Add new agents
-    for agent in agents:
-        try:
-            db.create_agent(agent)
-            print(f"Successfully created agent: {agent['name']}")
-        except Exception as e:
-            print(f"Error creating agent {agent['name']}: {e}")
+        print(f"Error loading agents: {e}")
 
 if __name__ == "__main__":
-    initialize_agents() 
\ No newline at end of file
+    initialize_agents() 
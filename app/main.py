@@ -1,7 +1,6 @@
 import streamlit as st
-import httpx
-from openai import OpenAI
-from database import Database
+from utils import get_database, show_flash
+from openai_client import KEY_CHECKING, KEY_INVALID, KEY_VALID, get_client, start_api_key_check
 import os
 from dotenv import load_dotenv
 
@@ -9,12 +8,13 @@ from dotenv import load_dotenv
 load_dotenv()
 
 def init_openai_client():
-    """Initialize OpenAI client with proper SSL handling"""
+    """Get the shared OpenAI client for the current API key, checking the key in the background"""
     try:
-        return OpenAI(
-            api_key=st.session_state.api_key or os.getenv("OPENAI_API_KEY"),
-            http_client=httpx.Client(verify=True)  # Use verify=True for production
-        )
+        api_key = st.session_state.api_key or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            return None
+        start_api_key_check(api_key)
+        return get_client(api_key)
     except Exception as e:
         st.error(f"Error initializing OpenAI client: {str(e)}")
         return None
@@ -24,7 +24,7 @@ def initialize_session_state():
     # Dictionary of session state variables and their default values
     session_vars = {
         'api_key': os.getenv("OPENAI_API_KEY"),
-        'chat_history': [],
+        'chat_session_ids': {},
         'db': None,
         'selected_agent': None,
         'openai_client': None,
@@ -43,13 +43,29 @@ def initialize_session_state():
     # Special initialization for database and OpenAI client
     if st.session_state.db is None:
         try:
-            st.session_state.db = Database()
+            st.session_state.db = get_database()
         except Exception as e:
             st.error(f"Failed to initialize database: {str(e)}")
     
     if st.session_state.openai_client is None:
         st.session_state.openai_client = init_openai_client()
 
+def openai_status():
+    """Sidebar label for the API key; never waits for the key check"""
+    if not st.session_state.api_key:
+        return 'No API key'
+    status = start_api_key_check(st.session_state.api_key)
+    return {
+        KEY_VALID: 'Connected',
+        KEY_INVALID: 'Invalid API key',
+        KEY_CHECKING: 'Checking API key…',
+    }.get(status, 'Unreachable')
+
+def logout():
+    """Clear the signed-in user; runs before the next script run"""
+    for key in ['user_name', 'is_authenticated']:
+        st.session_state[key] = None
+
 def check_authentication():
     """Check if user is authenticated"""
     return st.session_state.get('is_authenticated', False)
@@ -66,13 +82,7 @@ def main():
     initialize_session_state()
 
     # Display any error or success messages
-    if st.session_state.error_message:
-        st.error(st.session_state.error_message)
-        st.session_state.error_message = None
-    
-    if st.session_state.success_message:
-        st.success(st.session_state.success_message)
-        st.session_state.success_message = None
+    show_flash()
 
     # Title and description
     st.title("AI Agent Management System")
@@ -81,14 +91,11 @@ def main():
     with st.sidebar:
         st.markdown("### System Status")
         st.markdown(f"🔌 Database: {'Connected' if st.session_state.db else 'Disconnected'}")
-        st.markdown(f"🤖 OpenAI: {'Connected' if st.session_state.openai_client else 'Disconnected'}")
+        st.markdown(f"🤖 OpenAI: {openai_status()}")
         
         if st.session_state.user_name:
             st.markdown(f"👤 User: {st.session_state.user_name}")
-            if st.button("Logout"):
-                for key in ['user_name', 'is_authenticated']:
-                    st.session_state[key] = None
-                st.rerun()
+            st.button("Logout", on_click=logout)
 
     # Main content
     st.write("Welcome to the AI Agent Management System!")
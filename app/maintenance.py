@@ -0,0 +1,44 @@
+"""
+Database maintenance: purge long-deleted agents and compact the file.
+
+Agents deleted from the app are only marked inactive. This hard-deletes
+those deleted more than --retention-days ago, with their prompts,
+parameters, configs and chats, and clears rows orphaned by agents removed
+outright. It then releases free pages with incremental vacuum and
+refreshes the query planner's statistics. Safe to run while the app is
+live, e.g. nightly from cron.
+
+    python maintenance.py
+    python maintenance.py --retention-days 90 --no-compact
+"""
+import argparse
+import time
+
+from database import DB_PATH, PURGE_RETENTION_DAYS, Database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Purge deleted agents and compact the database")
+    parser.add_argument('--db', default=DB_PATH, help="database to maintain")
+    parser.add_argument('--retention-days', type=int, default=PURGE_RETENTION_DAYS,
+                        help="keep soft-deleted agents this many days before purging them")
+    parser.add_argument('--no-purge', action='store_true', help="skip purging deleted agents")
+    parser.add_argument('--no-compact', action='store_true', help="skip vacuum and analyze")
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    if not args.no_purge:
+        started = time.time()
+        purged, orphans = db.purge_deleted_agents(args.retention_days)
+        print(f"Purged {purged} agents deleted over {args.retention_days} days ago "
+              f"and {orphans} orphaned rows in {time.time() - started:.2f}s")
+    if not args.no_compact:
+        started = time.time()
+        before, after = db.compact()
+        print(f"Compacted {before / 1024:.0f} KiB to {after / 1024:.0f} KiB "
+              f"in {time.time() - started:.2f}s")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+import atexit
+import bisect
+import os
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stored next to agents.db (same working directory)
+METRICS_PATH = os.getenv("METRICS_PATH", "metrics.db")
+# Calls buffered in memory before they are written in one batch
+METRICS_FLUSH_BATCH = int(os.getenv("METRICS_FLUSH_BATCH", "50"))
+# Longest time in seconds a recorded call waits in memory before it is written
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "10"))
+# Days of call records kept in the metrics table
+METRICS_RETENTION_DAYS = int(os.getenv("METRICS_RETENTION_DAYS", "30"))
+# Port for a Prometheus /metrics endpoint in this process (off when unset)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Histogram bucket upper bounds in seconds, roughly 1-2.5-5 per decade
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 60.0, 120.0
+)
+# Timings recorded for each call
+TIMINGS = ('queue_time', 'ttft', 'latency')
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Cumulative fixed-bucket histogram; observe() is a bisect and two additions"""
+
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class AgentStats:
+    """In-process totals for one agent and prompt version"""
+
+    __slots__ = ('timings', 'calls', 'errors', 'retries', 'prompt_tokens', 'completion_tokens')
+
+    def __init__(self):
+        self.timings = {name: Histogram() for name in TIMINGS}
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(q * len(values)) - 1))]
+
+
+class MetricsRecorder:
+    """
+    Records every agent call in in-process histograms and a write buffer.
+
+    Recording takes one lock and touches only memory. Buffered calls are
+    written to the agent_calls table in a single executemany transaction once
+    METRICS_FLUSH_BATCH have piled up, or by a background thread every
+    METRICS_FLUSH_INTERVAL seconds.
+    """
+
+    def __init__(self, path=METRICS_PATH, flush_batch=METRICS_FLUSH_BATCH, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.flush_batch = flush_batch
+        self.stats = {}  # (agent_id, prompt_version) -> AgentStats
+        self._pending = []
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS agent_calls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            agent_id INTEGER NOT NULL,
+            prompt_version INTEGER,
+            recorded_at REAL NOT NULL,
+            queue_time REAL,
+            ttft REAL,
+            latency REAL NOT NULL,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            retries INTEGER NOT NULL DEFAULT 0,
+            error TEXT
+        )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_agent_calls_recorded ON agent_calls (recorded_at)')
+        self.conn.commit()
+
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(
+            target=self._flush_periodically,
+            args=(flush_interval,),
+            name="metrics-flush",
+            daemon=True
+        )
+        self._flusher.start()
+
+    def record_call(self, agent_id, prompt_version, latency, queue_time=None, ttft=None,
+                    prompt_tokens=None, completion_tokens=None, retries=0, error=None):
+        """Record one finished agent call; times are in seconds, error a short string"""
+        with self._lock:
+            stats = self.stats.get((agent_id, prompt_version))
+            if stats is None:
+                stats = self.stats[(agent_id, prompt_version)] = AgentStats()
+            stats.calls += 1
+            stats.retries += retries
+            if error is not None:
+                stats.errors += 1
+            stats.prompt_tokens += prompt_tokens or 0
+            stats.completion_tokens += completion_tokens or 0
+            for name, value in (('queue_time', queue_time), ('ttft', ttft), ('latency', latency)):
+                if value is not None:
+                    stats.timings[name].observe(value)
+
+            self._pending.append((
+                agent_id, prompt_version, time.time(), queue_time, ttft, latency,
+                prompt_tokens, completion_tokens, retries, error
+            ))
+            full = len(self._pending) >= self.flush_batch
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write buffered calls to SQLite in one transaction"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return
+        with self._db_lock:
+            self.conn.executemany('''
+            INSERT INTO agent_calls
+                (agent_id, prompt_version, recorded_at, queue_time, ttft, latency,
+                 prompt_tokens, completion_tokens, retries, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            self.conn.commit()
+
+    def _flush_periodically(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+                self.prune()
+            except sqlite3.Error as e:
+                print(f"Error flushing metrics: {e}")
+
+    def prune(self, retention_days=METRICS_RETENTION_DAYS):
+        """Delete call records older than the retention window"""
+        with self._db_lock:
+            self.conn.execute(
+                'DELETE FROM agent_calls WHERE recorded_at < ?',
+                (time.time() - retention_days * 86400,)
+            )
+            self.conn.commit()
+
+    def summary(self, since=None):
+        """
+        Per agent and prompt version totals and p50/p95/p99 timings from the table.
+
+        Covers every process writing to the metrics database, from `since`
+        (a Unix time) on. Buffered calls are flushed first.
+        """
+        self.flush()
+        with self._db_lock:
+            rows = self.conn.execute('''
+            SELECT agent_id, prompt_version, queue_time, ttft, latency,
+                prompt_tokens, completion_tokens, retries, error
+            FROM agent_calls
+            WHERE recorded_at >= ?
+            ORDER BY agent_id, prompt_version
+            ''', (since or 0,)).fetchall()
+
+        groups = {}
+        for agent_id, prompt_version, queue_time, ttft, latency, prompt_tokens, completion_tokens, retries, error in rows:
+            group = groups.get((agent_id, prompt_version))
+            if group is None:
+                group = groups[(agent_id, prompt_version)] = {
+                    'agent_id': agent_id,
+                    'prompt_version': prompt_version,
+                    'calls': 0, 'errors': 0, 'retries': 0,
+                    'prompt_tokens': 0, 'completion_tokens': 0,
+                    'timings': {name: [] for name in TIMINGS}
+                }
+            group['calls'] += 1
+            group['errors'] += error is not None
+            group['retries'] += retries
+            group['prompt_tokens'] += prompt_tokens or 0
+            group['completion_tokens'] += completion_tokens or 0
+            for name, value in (('queue_time', queue_time), ('ttft', ttft), ('latency', latency)):
+                if value is not None:
+                    group['timings'][name].append(value)
+
+        summary = []
+        for group in groups.values():
+            timings = group.pop('timings')
+            for name, values in timings.items():
+                values.sort()
+                for q in QUANTILES:
+                    group[f'{name}_p{round(q * 100)}'] = percentile(values, q)
+            summary.append(group)
+        return summary
+
+    def prometheus(self):
+        """This process's metrics in the Prometheus text exposition format"""
+        with self._lock:
+            snapshot = [
+                (agent_id, prompt_version, s.calls, s.errors, s.retries, s.prompt_tokens,
+                 s.completion_tokens, {name: (list(h.counts), h.count, h.sum) for name, h in s.timings.items()})
+                for (agent_id, prompt_version), s in self.stats.items()
+            ]
+
+        lines = []
+        counters = (
+            ('agent_calls_total', 'Agent calls', 2),
+            ('agent_call_errors_total', 'Agent calls that failed', 3),
+            ('agent_call_retries_total', 'Retried attempts of agent calls', 4),
+            ('agent_prompt_tokens_total', 'Prompt tokens sent to the model', 5),
+            ('agent_completion_tokens_total', 'Completion tokens received from the model', 6),
+        )
+        for name, help_text, index in counters:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for row in snapshot:
+                lines.append(f'{name}{{agent_id="{row[0]}",prompt_version="{row[1]}"}} {row[index]}')
+
+        for timing in TIMINGS:
+            name = f'agent_call_{timing}_seconds'
+            lines.append(f'# HELP {name} Agent call {timing.replace("_", " ")} in seconds')
+            lines.append(f'# TYPE {name} histogram')
+            for agent_id, prompt_version, *_, timings in snapshot:
+                counts, count, total = timings[timing]
+                labels = f'agent_id="{agent_id}",prompt_version="{prompt_version}"'
+                cumulative = 0
+                for bound, bucket_count in zip(LATENCY_BUCKETS, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{{labels}}} {total}')
+                lines.append(f'{name}_count{{{labels}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+        self.conn.close()
+
+
+class CallTimer:
+    """
+    Times one agent call and records it when finished.
+
+    Create it when the call is requested (or pass the perf_counter time it
+    was), call started() when it actually begins after any queueing,
+    first_token() when the first text arrives, and finish() once with the
+    outcome.
+    """
+
+    __slots__ = ('agent_id', 'prompt_version', 'requested_at', 'started_at', 'first_token_at', 'retries')
+
+    def __init__(self, agent, requested_at=None):
+        self.agent_id = agent.id
+        self.prompt_version = agent.prompt_version
+        self.requested_at = requested_at or time.perf_counter()
+        self.started_at = None
+        self.first_token_at = None
+        self.retries = 0
+
+    def started(self):
+        self.started_at = time.perf_counter()
+
+    def retried(self, *args):
+        """Usable directly as the on_retry hook of call_with_retries"""
+        self.retries += 1
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def finish(self, usage=None, error=None):
+        """Record the call; usage is the response's usage object, if any"""
+        now = time.perf_counter()
+        started_at = self.started_at or self.requested_at
+        get_metrics().record_call(
+            self.agent_id,
+            self.prompt_version,
+            latency=now - started_at,
+            queue_time=started_at - self.requested_at,
+            ttft=self.first_token_at - started_at if self.first_token_at else None,
+            prompt_tokens=getattr(usage, 'prompt_tokens', None),
+            completion_tokens=getattr(usage, 'completion_tokens', None),
+            retries=self.retries,
+            error=type(error).__name__ if error is not None else None
+        )
+
+
+class _ExporterHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        payload = get_metrics().prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_exporter(port, host='0.0.0.0'):
+    """Serve this process's metrics at /metrics for Prometheus to scrape"""
+    server = ThreadingHTTPServer((host, port), _ExporterHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+    return server
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Get the process-wide metrics recorder"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRecorder()
+                atexit.register(_metrics.close)
+                if METRICS_PORT:
+                    try:
+                        start_exporter(METRICS_PORT)
+                    except OSError as e:
+                        print(f"Error starting metrics exporter on port {METRICS_PORT}: {e}")
+    return _metrics
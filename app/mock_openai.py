@@ -0,0 +1,207 @@
+"""
+Local OpenAI-compatible stub server for testing and benchmarks.
+
+Serves /v1/chat/completions (plain and streaming) and /v1/models with
+configurable latency and failure injection (429 with Retry-After, or
+any other status). Point clients at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and any API key.
+
+    python mock_openai.py --port 8000 --latency 0.2 --chunk-delay 0.01 --fail-rate 0.1
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockConfig:
+    """Behaviour of the stub, shared by every request"""
+
+    def __init__(self, latency=0.0, chunk_delay=0.0, words=50, fail_rate=0.0, retry_after=1.0, fail_status=429):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.words = words
+        self.fail_rate = fail_rate
+        self.retry_after = retry_after
+        self.fail_status = fail_status
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def _response_words(messages, count):
+    """Deterministic filler text derived from the last user message"""
+    question = next((m['content'] for m in reversed(messages) if m['role'] == 'user'), '')
+    seed = question.split() or ['mock']
+    return [seed[i % len(seed)] for i in range(count)]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without TCP_NODELAY every
+    # response would stall on delayed ACKs and skew benchmark latencies
+    disable_nagle_algorithm = True
+    config = MockConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {
+                'object': 'list',
+                'data': [{'id': 'gpt-4o', 'object': 'model', 'created': 0, 'owned_by': 'mock'}]
+            })
+        else:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+
+        config = self.config
+        with config.lock:
+            config.requests += 1
+
+        if config.fail_rate and random.random() < config.fail_rate:
+            if config.fail_status == 429:
+                self._send_json(
+                    429,
+                    {'error': {'message': 'Rate limit exceeded (mock)', 'type': 'rate_limit_error'}},
+                    {'Retry-After': str(config.retry_after)}
+                )
+            else:
+                self._send_json(
+                    config.fail_status,
+                    {'error': {'message': 'Upstream failure (mock)', 'type': 'server_error'}}
+                )
+            return
+
+        time.sleep(config.latency)
+        words = _response_words(request.get('messages', []), config.words)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = request.get('model', 'gpt-4o')
+        prompt_tokens = sum(len(m.get('content', '').split()) for m in request.get('messages', []))
+
+        if request.get('stream'):
+            usage = None
+            if (request.get('stream_options') or {}).get('include_usage'):
+                usage = {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': len(words),
+                    'total_tokens': prompt_tokens + len(words)
+                }
+            self._stream(completion_id, model, words, usage)
+            return
+
+        self._send_json(200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': ' '.join(words)},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': len(words),
+                'total_tokens': prompt_tokens + len(words)
+            }
+        })
+
+    def _stream(self, completion_id, model, words, usage=None):
+        """Send the response as server-sent events, one word per chunk, then usage if asked for"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def event(delta, finish_reason=None, **extra):
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}] if delta is not None else [],
+                **extra
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        event({'role': 'assistant', 'content': ''})
+        for i, word in enumerate(words):
+            time.sleep(self.config.chunk_delay)
+            event({'content': word if i == 0 else ' ' + word})
+        event({}, 'stop')
+        if usage is not None:
+            event(None, usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def make_server(host='127.0.0.1', port=0, **config):
+    """Create a stub server with its own MockConfig"""
+    handler = type('ConfiguredMockHandler', (MockHandler,), {'config': MockConfig(**config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_server(host='127.0.0.1', port=0, **config):
+    """Start the stub on a background thread; returns (server, base_url)"""
+    server = make_server(host, port, **config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds before the first byte")
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument('--words', type=int, default=50, help="words per response")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument('--fail-status', type=int, default=429, help="HTTP status of failed requests")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host,
+        args.port,
+        latency=args.latency,
+        chunk_delay=args.chunk_delay,
+        words=args.words,
+        fail_rate=args.fail_rate,
+        retry_after=args.retry_after,
+        fail_status=args.fail_status
+    )
+    print(f"Mock OpenAI server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
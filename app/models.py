@@ -1,35 +1,79 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
+import json
 
-@dataclass
+@dataclass(frozen=True, slots=True)
+class AgentParameter:
+    name: str
+    param_type: str = 'string'
+    is_required: bool = True
+    description: Optional[str] = None
+    default_value: Optional[str] = None
+
+@dataclass(frozen=True, slots=True)
 class Agent:
-    id: Optional[int]
+    """
+    An active agent with its current prompt, parameters and decoded configs.
+
+    Instances are shared between sessions through the Database catalog, so
+    they are immutable.
+    """
+    id: int
     name: str
     expertise: str
     description: str
     agent_type: str
-    query: Dict[str, Any]
-    created_at: datetime = datetime.now()
-    updated_at: datetime = datetime.now()
+    prompt: Optional[str] = None
+    prompt_version: Optional[int] = None
+    parameters: Tuple[str, ...] = ()
+    parameter_specs: Tuple[AgentParameter, ...] = ()
+    configs: Dict[str, Any] = field(default_factory=dict)
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
     is_active: bool = True
 
+    # Column order expected by from_db_row
+    COLUMNS = (
+        'id', 'name', 'expertise', 'description', 'agent_type', 'created_at',
+        'updated_at', 'prompt', 'prompt_version', 'parameters', 'configs'
+    )
+
     @classmethod
     def from_db_row(cls, row):
-        """Create Agent instance from database row"""
-        import json
+        """
+        Create Agent instance from database row
+
+        The row holds the COLUMNS fields, with parameters as a JSON array of
+        [name, type, is_required, description, default_value] and configs as a
+        JSON object.
+        """
+        (agent_id, name, expertise, description, agent_type, created_at,
+         updated_at, prompt, prompt_version, parameters, configs) = row
+        specs = tuple(
+            AgentParameter(p[0], p[1], bool(p[2]), p[3], p[4])
+            for p in json.loads(parameters or '[]')
+        )
         return cls(
-            id=row[0],
-            name=row[1],
-            expertise=row[2],
-            description=row[3],
-            agent_type=row[4],
-            query=json.loads(row[5]),
-            created_at=datetime.fromisoformat(row[6]) if len(row) > 6 else datetime.now(),
-            updated_at=datetime.fromisoformat(row[7]) if len(row) > 7 else datetime.now(),
-            is_active=row[8] if len(row) > 8 else True
+            id=agent_id,
+            name=name,
+            expertise=expertise,
+            description=description,
+            agent_type=agent_type,
+            prompt=prompt,
+            prompt_version=prompt_version,
+            parameters=tuple(spec.name for spec in specs),
+            parameter_specs=specs,
+            configs=json.loads(configs or '{}'),
+            created_at=datetime.fromisoformat(created_at) if created_at else None,
+            updated_at=datetime.fromisoformat(updated_at) if updated_at else None
         )
 
+    @classmethod
+    def from_db_rows(cls, rows):
+        """Build Agents in bulk straight from cursor rows"""
+        return tuple(map(cls.from_db_row, rows))
+
     def to_dict(self):
         """Convert Agent to dictionary"""
         return {
@@ -38,8 +82,11 @@ class Agent:
             'expertise': self.expertise,
             'description': self.description,
             'agent_type': self.agent_type,
-            'query': self.query,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat(),
+            'prompt': self.prompt,
+            'prompt_version': self.prompt_version,
+            'parameters': list(self.parameters),
+            'configs': self.configs,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
             'is_active': self.is_active
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,182 @@
+import atexit
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+# Connection settings for the shared OpenAI clients (overridable via environment)
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_VERIFY_SSL = os.getenv("OPENAI_VERIFY_SSL", "true").lower() not in ("0", "false", "no")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+# Seconds an API key check result is trusted, and how long a check stays
+# cached when the API could not be reached
+API_KEY_CHECK_TTL = float(os.getenv("API_KEY_CHECK_TTL", "900"))
+API_KEY_CHECK_RETRY = float(os.getenv("API_KEY_CHECK_RETRY", "30"))
+# Seconds a single key check may take
+API_KEY_CHECK_TIMEOUT = float(os.getenv("API_KEY_CHECK_TIMEOUT", "5"))
+
+# API key check results
+KEY_VALID = 'valid'
+KEY_INVALID = 'invalid'
+KEY_UNREACHABLE = 'unreachable'
+KEY_CHECKING = 'checking'
+
+# Process-wide registry of clients, keyed by API key
+_clients = {}
+_async_clients = {}
+_lock = threading.Lock()
+
+
+def _timeout():
+    return httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+    )
+
+
+def get_client(api_key, base_url=None):
+    """
+    Get the shared OpenAI client for an API key, creating it on first use.
+
+    Every caller in the process reuses the same client and therefore the same
+    keep-alive connection pool, so only the first request pays for the TCP and
+    TLS handshake.
+    """
+    base_url = base_url or OPENAI_BASE_URL
+    key = (api_key, base_url)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=_timeout(),
+                http_client=httpx.Client(
+                    verify=OPENAI_VERIFY_SSL,
+                    timeout=_timeout(),
+                    limits=_limits()
+                )
+            )
+            _clients[key] = client
+    return client
+
+
+def get_async_client(api_key, base_url=None):
+    """
+    Get the shared AsyncOpenAI client for an API key.
+
+    Async connection pools belong to the event loop that opened them, so this
+    must only be called from coroutines running on async_chat's background loop.
+    """
+    base_url = base_url or OPENAI_BASE_URL
+    key = (api_key, base_url)
+    client = _async_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _async_clients.get(key)
+            if client is None:
+                client = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=_timeout(),
+                    http_client=httpx.AsyncClient(
+                        verify=OPENAI_VERIFY_SSL,
+                        timeout=_timeout(),
+                        limits=_limits()
+                    )
+                )
+                _async_clients[key] = client
+    return client
+
+
+# Key check results by key hash: (status, expires_at), plus checks in flight
+_key_checks = {}
+_key_checks_running = {}
+_key_checks_lock = threading.Lock()
+_key_check_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="api-key-check")
+
+
+def _key_hash(api_key, base_url):
+    """Cache key for a key check; the API key itself is never stored"""
+    return hashlib.sha256(f"{base_url or OPENAI_BASE_URL}\0{api_key}".encode('utf-8')).hexdigest()
+
+
+def _run_key_check(api_key, base_url, key_hash):
+    """List models with the key and cache whether it was accepted"""
+    try:
+        client = get_client(api_key, base_url).with_options(
+            max_retries=0,
+            timeout=API_KEY_CHECK_TIMEOUT
+        )
+        client.models.list()
+        status, ttl = KEY_VALID, API_KEY_CHECK_TTL
+    except (openai.AuthenticationError, openai.PermissionDeniedError):
+        status, ttl = KEY_INVALID, API_KEY_CHECK_TTL
+    except Exception:
+        status, ttl = KEY_UNREACHABLE, API_KEY_CHECK_RETRY
+
+    with _key_checks_lock:
+        _key_checks[key_hash] = (status, time.monotonic() + ttl)
+        _key_checks_running.pop(key_hash, None)
+    return status
+
+
+def start_api_key_check(api_key, base_url=None):
+    """
+    Get an API key's cached status, starting a background check if it has none.
+
+    Returns KEY_CHECKING while a check is running. The check lists models,
+    which needs no tokens, and its result is cached per key hash.
+    """
+    key_hash = _key_hash(api_key, base_url)
+    with _key_checks_lock:
+        cached = _key_checks.get(key_hash)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        if key_hash not in _key_checks_running:
+            _key_checks_running[key_hash] = _key_check_executor.submit(
+                _run_key_check, api_key, base_url, key_hash
+            )
+    return KEY_CHECKING
+
+
+def check_api_key(api_key, base_url=None):
+    """Get an API key's status, waiting for the check if it isn't cached"""
+    status = start_api_key_check(api_key, base_url)
+    if status != KEY_CHECKING:
+        return status
+    with _key_checks_lock:
+        future = _key_checks_running.get(_key_hash(api_key, base_url))
+    if future is None:
+        # Finished between the two lookups
+        return start_api_key_check(api_key, base_url)
+    return future.result()
+
+
+def close_clients():
+    """Close every pooled sync client (used on process shutdown)"""
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+atexit.register(close_clients)
@@ -1,41 +1,58 @@
+import difflib
 import streamlit as st
-from database import Database
-import time
+from database import ConcurrentUpdateError
+from utils import flash, get_database, show_flash
+from prompts import find_placeholders
 
-# Initialize session state if needed
-if 'db' not in st.session_state:
-    st.session_state.db = Database()
+# Shared, process-wide database handle
+db = get_database()
 
 # Check if we're editing an existing agent
 is_editing = st.session_state.get('selected_agent') is not None
 agent_to_edit = st.session_state.get('selected_agent')
 
+def rollback_prompt(agent_id, version):
+    """Make an earlier prompt version active and reload the agent being edited"""
+    if db.activate_prompt_version(agent_id, version):
+        st.session_state.selected_agent = db.get_agent_details(agent_id)
+        flash(f"Prompt rolled back to version {version}.")
+    else:
+        flash(f"Could not roll back: the agent or its prompt version {version} no longer exists.", 'error')
+
+def reload_agent(agent_id):
+    """Start editing again from the latest saved version of the agent"""
+    st.session_state.selected_agent = db.get_agent_details(agent_id)
+    if st.session_state.selected_agent is None:
+        flash("The agent you were editing has been deleted.", 'error')
+
 if is_editing:
-    st.header(f"Edit Agent: {agent_to_edit[1]}")
+    st.header(f"Edit Agent: {agent_to_edit.name}")
 else:
     st.header("Create New Agent")
 
+show_flash()
+
 # Form for agent details
 with st.form("agent_form"):
     name = st.text_input(
         "Agent Name", 
-        value=agent_to_edit[1] if is_editing else ""
+        value=agent_to_edit.name if is_editing else ""
     )
     
     expertise = st.text_input(
         "Expertise",
-        value=agent_to_edit[2] if is_editing else ""
+        value=agent_to_edit.expertise if is_editing else ""
     )
     
     description = st.text_area(
         "Description",
-        value=agent_to_edit[3] if is_editing else "",
+        value=agent_to_edit.description if is_editing else "",
         height=100
     )
     
     prompt = st.text_area(
         "Agent Prompt",
-        value=agent_to_edit[4] if is_editing else "",
+        value=agent_to_edit.prompt if is_editing else "",
         height=300,
         help="Use markdown formatting. Use {param} for parameters."
     )
@@ -44,20 +61,68 @@ with st.form("agent_form"):
     with col1:
         agent_type = st.text_input(
             "Agent Type",
-            value=agent_to_edit[5] if is_editing else ""
+            value=agent_to_edit.agent_type if is_editing else ""
         )
     
     with col2:
         required_params = st.text_input(
             "Required Parameters (comma-separated)",
-            value=agent_to_edit[6] if is_editing else "",
+            value=','.join(agent_to_edit.parameters) if is_editing else "",
             help="Example: sector,region,timeframe"
         )
     
     submitted = st.form_submit_button("Save Agent")
 
+# Compare the active prompt with an earlier version and roll back to it
+if is_editing:
+    versions = db.get_prompt_versions(agent_to_edit.id)
+    if len(versions) > 1:
+        with st.expander(f"Prompt History ({len(versions)} versions)"):
+            labels = {
+                version: f"v{version} - {created_at}" + (" (active)" if is_active else "")
+                for version, created_at, _, _, is_active in versions
+            }
+            default = next((i for i, row in enumerate(versions) if not row[4]), 0)
+            version = st.selectbox(
+                "Version",
+                list(labels),
+                index=default,
+                format_func=labels.get,
+                key=f"prompt_history_{agent_to_edit.id}"
+            )
+            version_text = db.get_prompt_version(agent_to_edit.id, version)
+            if version_text is None:
+                # Purged or replaced by an import since the list was loaded
+                st.warning(f"Version {version} no longer exists.")
+            else:
+                diff = '\n'.join(difflib.unified_diff(
+                    agent_to_edit.prompt.splitlines(),
+                    version_text.splitlines(),
+                    f"v{agent_to_edit.prompt_version} (active)",
+                    f"v{version}",
+                    lineterm=''
+                ))
+                if diff:
+                    st.code(diff, language='diff')
+                else:
+                    st.info("This version has the same text as the active prompt.")
+                st.button(
+                    "Roll Back to This Version",
+                    on_click=rollback_prompt,
+                    args=(agent_to_edit.id, version),
+                    disabled=version == agent_to_edit.prompt_version
+                )
+
 if submitted:
-    if all([name, expertise, description, prompt, agent_type, required_params]):
+    # Every {param} in the prompt has to be one of the declared parameters
+    declared_params = {param.strip() for param in required_params.split(',')}
+    undeclared_params = [param for param in find_placeholders(prompt) if param not in declared_params]
+
+    if not all([name, expertise, description, prompt, agent_type, required_params]):
+        st.error("All fields are required!")
+    elif undeclared_params:
+        st.error(f"Prompt uses undeclared parameters: {', '.join(undeclared_params)}")
+    else:
         agent_data = {
             "name": name,
             "expertise": expertise,
@@ -69,22 +134,23 @@ if submitted:
         
         try:
             if is_editing:
-                st.session_state.db.update_agent(agent_to_edit[0], agent_data)
-                st.success(f"Agent '{name}' updated successfully!")
+                # Refuse to overwrite changes saved since this agent was loaded
+                db.update_agent(agent_to_edit.id, agent_data, expected_updated_at=agent_to_edit.updated_at)
+                flash(f"Agent '{name}' updated successfully!")
             else:
-                st.session_state.db.create_agent(agent_data)
-                st.success(f"Agent '{name}' created successfully!")
+                db.create_agent(agent_data)
+                flash(f"Agent '{name}' created successfully!")
             
             # Clear the selected agent from session state
             st.session_state.selected_agent = None
             
-            # Redirect back to view agents
-            time.sleep(1)  # Give time for the success message
+            # Redirect back to view agents, which shows the message
             st.switch_page("pages/2_View_Agents.py")
+        except ConcurrentUpdateError as e:
+            st.error(f"{e} Copy any edits you want to keep, then load the latest version.")
+            st.button("Load Latest Version", on_click=reload_agent, args=(agent_to_edit.id,))
         except Exception as e:
             st.error(f"Error saving agent: {str(e)}")
-    else:
-        st.error("All fields are required!")
 
 # Add a cancel button
 if st.button("Cancel"):
@@ -1,96 +1,163 @@
 import streamlit as st
-from database import Database
-import time
+from utils import flash, get_database, show_flash
 
-# Initialize session state if needed
-if 'db' not in st.session_state:
-    st.session_state.db = Database()
+# Search results shown per page
+SEARCH_PAGE_SIZE = 20
+# Choices for the number of agents listed per page
+PAGE_SIZES = [10, 20, 50]
+DEFAULT_PAGE_SIZE = 20
+
+# Shared, process-wide database handle
+db = get_database()
 
 st.header("View Agents")
+show_flash()
+
+# Card styling, injected once per page run
+st.markdown("""
+<style>
+.agent-card {
+    padding: 20px;
+    border-radius: 10px;
+    background-color: #f0f2f6;
+    margin: 10px 0;
+}
+</style>
+""", unsafe_allow_html=True)
 
-# Get all agents from the database
-agents = st.session_state.db.get_agents()
+# Add search/filter functionality
+search = st.text_input("🔍 Search agents by name, expertise, description or prompt", "")
 
-if not agents:
-    st.info("No agents found. Create one first!")
+if search:
+    # Search runs against the full-text index, one page at a time
+    if st.session_state.get('agent_search') != search:
+        st.session_state.agent_search = search
+        st.session_state.agent_search_page = 0
+    page = st.session_state.get('agent_search_page', 0)
+
+    # Fetch one extra result to know whether there is a next page
+    results = db.search_agents(search, limit=SEARCH_PAGE_SIZE + 1, offset=page * SEARCH_PAGE_SIZE)
+    page_agents = results[:SEARCH_PAGE_SIZE]
+    has_previous = page > 0
+    has_next = len(results) > SEARCH_PAGE_SIZE
 else:
-    # Add search/filter functionality
-    search = st.text_input("🔍 Search agents by name or expertise", "")
-    
-    # Filter agents based on search
-    filtered_agents = agents
+    # Browse by id; the stack holds the id each visited page starts after
+    page_size = st.session_state.get('agent_page_size', DEFAULT_PAGE_SIZE)
+    cursors = st.session_state.setdefault('agent_page_cursors', [None])
+    results = db.get_agents_page(after_id=cursors[-1], limit=page_size + 1)
+    page_agents = results[:page_size]
+    page = len(cursors) - 1
+    has_previous = page > 0
+    has_next = len(results) > page_size
+
+
+def show_previous_page():
+    if search:
+        st.session_state.agent_search_page -= 1
+    else:
+        st.session_state.agent_page_cursors.pop()
+
+
+def show_next_page():
+    if search:
+        st.session_state.agent_search_page += 1
+    else:
+        st.session_state.agent_page_cursors.append(page_agents[-1].id)
+
+
+def delete_agent(agent):
+    """Delete before the next run, so the page is rendered once without the agent"""
+    if db.delete_agent(agent.id):
+        flash(f"Agent '{agent.name}' deleted successfully!")
+    else:
+        flash("Failed to delete agent!", 'error')
+
+
+def reset_pages():
+    st.session_state.agent_page_cursors = [None]
+
+
+if not page_agents:
     if search:
-        filtered_agents = [
-            agent for agent in agents 
-            if search.lower() in agent[1].lower() or search.lower() in agent[2].lower()
-        ]
-    
+        st.info("No agents match your search.")
+    elif has_previous:
+        st.info("No more agents.")
+    else:
+        st.info("No agents found. Create one first!")
+else:
     # Display agents in a cleaner layout
-    for agent in filtered_agents:
+    for agent in page_agents:
         with st.container():
-            # Create a card-like container
-            st.markdown("""
-            <style>
-            .agent-card {
-                padding: 20px;
-                border-radius: 10px;
-                background-color: #f0f2f6;
-                margin: 10px 0;
-            }
-            </style>
-            """, unsafe_allow_html=True)
-            
-            with st.container():
-                # Header row
-                col1, col2 = st.columns([3, 1])
-                with col1:
-                    st.markdown(f"### {agent[1]}")
-                    st.markdown(f"*{agent[2]}*")
-                
-                with col2:
-                    # Action buttons in a more compact layout
-                    cols = st.columns(3)
-                    with cols[0]:
-                        if st.button("💬", key=f"chat_{agent[0]}", help="Chat with agent"):
-                            st.session_state.selected_agent = agent
-                            time.sleep(0.1)  # Small delay to ensure state is updated
-                            st.switch_page("pages/3_Chat.py")
-                    
-                    with cols[1]:
-                        if st.button("✏️", key=f"edit_{agent[0]}", help="Edit agent"):
-                            st.session_state.selected_agent = agent
-                            time.sleep(0.1)  # Small delay to ensure state is updated
-                            st.switch_page("pages/1_Create_Agent.py")
-                    
-                    with cols[2]:
-                        if st.button("🗑️", key=f"delete_{agent[0]}", help="Delete agent"):
-                            if st.session_state.db.delete_agent(agent[0]):
-                                st.success(f"Agent '{agent[1]}' deleted successfully!")
-                                time.sleep(1)  # Give time for the success message
-                                st.rerun()
-                            else:
-                                st.error("Failed to delete agent!")
-                
-                # Details section
-                with st.expander("View Details"):
-                    st.markdown("**Description:**")
-                    st.write(agent[3])
-                    
-                    st.markdown("**Type:**")
-                    st.write(agent[5])
-                    
-                    st.markdown("**Required Parameters:**")
-                    params = agent[6].split(',')
-                    for param in params:
-                        st.markdown(f"- {param.strip()}")
-                    
-                    st.markdown("**Prompt Template:**")
-                    st.code(agent[4], language="markdown")
-            
-            st.divider()
+            # Header row
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.markdown(f"### {agent.name}")
+                st.markdown(f"*{agent.expertise}*")
+
+            with col2:
+                # Action buttons in a more compact layout
+                cols = st.columns(3)
+                with cols[0]:
+                    if st.button("💬", key=f"chat_{agent.id}", help="Chat with agent"):
+                        # Listed agents may omit the prompt, so hand over the full agent
+                        st.session_state.selected_agent = db.get_agent_details(agent.id)
+                        st.switch_page("pages/3_Chat.py")
+
+                with cols[1]:
+                    if st.button("✏️", key=f"edit_{agent.id}", help="Edit agent"):
+                        st.session_state.selected_agent = db.get_agent_details(agent.id)
+                        st.switch_page("pages/1_Create_Agent.py")
+
+                with cols[2]:
+                    st.button(
+                        "🗑️",
+                        key=f"delete_{agent.id}",
+                        help="Delete agent",
+                        on_click=delete_agent,
+                        args=(agent,)
+                    )
+
+            # Details section
+            with st.expander("View Details"):
+                st.markdown("**Description:**")
+                st.write(agent.description)
+
+                st.markdown("**Type:**")
+                st.write(agent.agent_type)
+
+                st.markdown("**Required Parameters:**")
+                for param in agent.parameters:
+                    st.markdown(f"- {param}")
+
+                # Prompt bodies can be long; fetch one only when asked for
+                if st.toggle("Show Prompt Template", key=f"show_prompt_{agent.id}"):
+                    prompt = agent.prompt
+                    if prompt is None:
+                        fields = db.get_agent_fields(agent.id, ('prompt',))
+                        prompt = fields['prompt'] if fields else ""
+                    st.code(prompt, language="markdown")
+
+        st.divider()
+
+# Page navigation
+prev_col, info_col, next_col = st.columns([1, 2, 1])
+with prev_col:
+    st.button("← Previous", disabled=not has_previous, on_click=show_previous_page)
+with info_col:
+    st.caption(f"Page {page + 1}")
+with next_col:
+    st.button("Next →", disabled=not has_next, on_click=show_next_page)
+
+if not search:
+    st.selectbox(
+        "Agents per page",
+        PAGE_SIZES,
+        index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE),
+        key='agent_page_size',
+        on_change=reset_pages
+    )
 
 # Add a floating action button to create new agent
 st.sidebar.markdown("### Quick Actions")
 if st.sidebar.button("➕ Create New Agent", use_container_width=True):
-    time.sleep(0.1)  # Small delay to ensure state is updated
-    st.switch_page("pages/1_Create_Agent.py")
\ No newline at end of file
+    st.switch_page("pages/1_Create_Agent.py")
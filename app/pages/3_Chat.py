@@ -1,35 +1,76 @@
 import streamlit as st
-from database import Database
-from utils import process_agent_query
-from openai import OpenAI
+from utils import flash, get_database, process_agent_query, show_flash, stream_agent_query
+from openai_client import get_client, start_api_key_check
+from response_cache import get_response_cache
+from prompts import compile_prompt
+from resilience import AgentCallError
+from context import ConversationContext
 
-# Initialize session state if needed
-if 'db' not in st.session_state:
-    st.session_state.db = Database()
-if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
+# Shared, process-wide database handle
+db = get_database()
+# Messages shown per page of chat history
+CHAT_PAGE_SIZE = 20
+
+if 'chat_session_ids' not in st.session_state:
+    # Active chat session per agent id
+    st.session_state.chat_session_ids = {}
+if 'chat_windows' not in st.session_state:
+    # Loaded messages and model context per chat session id
+    st.session_state.chat_windows = {}
+if 'stream_responses' not in st.session_state:
+    st.session_state.stream_responses = True
 
 st.header("Chat with Agent")
+show_flash()
+
+def load_chat_window(session_id):
+    """Load the latest page of a session and rebuild its model context from it"""
+    rows = db.get_chat_messages(session_id, CHAT_PAGE_SIZE + 1)
+    window = {
+        'messages': rows[-CHAT_PAGE_SIZE:],
+        'has_older': len(rows) > CHAT_PAGE_SIZE,
+        # Token-budgeted view of the conversation that is sent to the model
+        'context': ConversationContext()
+    }
+    for _, role, content in window['messages']:
+        window['context'].append(role, content)
+    return window
+
+def load_older_messages(window, session_id):
+    """Prepend the page of messages before the oldest one loaded"""
+    rows = db.get_chat_messages(session_id, CHAT_PAGE_SIZE + 1, before_id=window['messages'][0][0])
+    window['has_older'] = len(rows) > CHAT_PAGE_SIZE
+    window['messages'] = rows[-CHAT_PAGE_SIZE:] + window['messages']
+
+def save_api_key():
+    """Store the entered key; the run that follows starts with it set"""
+    api_key = st.session_state.api_key_input
+    if api_key:
+        st.session_state.api_key = api_key
+        # Initialize OpenAI client and check the key in the background
+        st.session_state.openai_client = get_client(api_key)
+        start_api_key_check(api_key)
+        flash("API key saved! You can now chat with agents.")
+
+def start_new_chat(agent_id, session_key):
+    st.session_state.chat_session_ids.pop(agent_id, None)
+    st.session_state.pop(session_key, None)
 
 # Debug information in sidebar
 st.sidebar.write("Debug Information:")
 st.sidebar.write(f"OpenAI Client initialized: {st.session_state.openai_client is not None}")
 st.sidebar.write(f"API Key present: {st.session_state.api_key is not None}")
+if st.session_state.get('api_key'):
+    st.sidebar.write(f"API Key status: {start_api_key_check(st.session_state.api_key)}")
 
 # Check for API key at the start of chat
 if 'api_key' not in st.session_state or not st.session_state.api_key:
     st.warning("OpenAI API key is required to chat with agents.")
-    api_key = st.text_input("Enter your OpenAI API key:", type="password")
-    if api_key:
-        st.session_state.api_key = api_key
-        # Initialize OpenAI client
-        st.session_state.openai_client = OpenAI(api_key=api_key)
-        st.success("API key saved! You can now chat with agents.")
-        st.rerun()
+    st.text_input("Enter your OpenAI API key:", type="password", key="api_key_input", on_change=save_api_key)
     st.stop()
 
 # Get all agents
-agents = st.session_state.db.get_agents()
+agents = db.get_agents()
 if not agents:
     st.info("No agents found. Create one first!")
     st.stop()
@@ -38,26 +79,49 @@ if not agents:
 selected_agent = st.selectbox(
     "Select Agent",
     options=agents,
-    format_func=lambda x: x[1]  # Display agent name
+    format_func=lambda agent: agent.name
 )
 
 if selected_agent:
-    agent_id, name, expertise, description, agent_type, prompt_template, parameters = selected_agent
-    
     # Display agent info
     with st.expander("Agent Information"):
-        st.write(f"**Expertise:** {expertise}")
-        st.write(f"**Description:** {description}")
-        st.write(f"**Type:** {agent_type}")
-        if parameters:
-            st.write("**Required Parameters:**", parameters)
+        st.write(f"**Expertise:** {selected_agent.expertise}")
+        st.write(f"**Description:** {selected_agent.description}")
+        st.write(f"**Type:** {selected_agent.agent_type}")
+        if selected_agent.parameters:
+            st.write("**Required Parameters:**", ', '.join(selected_agent.parameters))
     
-    st.subheader(f"Chatting with {name}")
+    # Values for the {param} placeholders in the agent's prompt
+    compiled_prompt = compile_prompt(selected_agent)
+    param_values = {}
+    if compiled_prompt.placeholders:
+        with st.expander("Parameters", expanded=True):
+            for param in dict.fromkeys(compiled_prompt.placeholders):
+                param_values[param] = st.text_input(
+                    param.replace('_', ' ').title(),
+                    key=f"param_{selected_agent.id}_{param}"
+                )
+        missing = compiled_prompt.missing(param_values)
+        if missing:
+            st.caption(f"Parameters not set: {', '.join(missing)}")
     
+    st.subheader(f"Chatting with {selected_agent.name}")
+
+    session_id = st.session_state.chat_session_ids.get(selected_agent.id)
+    if session_id is not None and session_id not in st.session_state.chat_windows:
+        st.session_state.chat_windows[session_id] = load_chat_window(session_id)
+    window = st.session_state.chat_windows.get(session_id) or {
+        'messages': [], 'has_older': False, 'context': ConversationContext()
+    }
+
+    # Only the latest page is rendered; older messages load on demand
+    if window['has_older']:
+        st.button("Load older messages", on_click=load_older_messages, args=(window, session_id))
+
     # Display chat history
-    for message in st.session_state.chat_history:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    for _, role, content in window['messages']:
+        with st.chat_message(role):
+            st.markdown(content)
     
     # Chat input
     user_input = st.chat_input("Your message")
@@ -67,66 +131,82 @@ if selected_agent:
         with st.chat_message("user"):
             st.markdown(user_input)
         
-        # Add to chat history
-        st.session_state.chat_history.append({
-            "role": "user",
-            "content": user_input
-        })
-        
+        # Earlier turns, trimmed to the context token budget
+        history = window['context'].messages()
+
         # Process and display assistant response
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                try:
-                    # Get agent details for better context
-                    agent_details = st.session_state.db.get_agent_details(agent_id)
-                    
-                    # Prepare agent data with full context
-                    agent_data = {
-                        'id': agent_id,
-                        'name': name,
-                        'expertise': expertise,
-                        'description': description,
-                        'prompt': prompt_template,
-                        'parameters': parameters.split(',') if parameters else [],
-                        'type': agent_type,
-                        'configs': agent_details.get('configs', {})
-                    }
-                    
-                    # Get response with timeout handling
-                    try:
+            try:
+                if st.session_state.stream_responses:
+                    # Render deltas as they arrive; write_stream returns the full text
+                    response = st.write_stream(stream_agent_query(
+                        st.session_state.api_key,
+                        selected_agent,
+                        user_input,
+                        param_values,
+                        history
+                    ))
+                else:
+                    with st.spinner("Thinking..."):
                         response = process_agent_query(
                             st.session_state.api_key,
-                            agent_data,
-                            user_input
+                            selected_agent,
+                            user_input,
+                            param_values,
+                            history
                         )
-                    except TimeoutError:
-                        raise Exception("Request timed out. Please try again.")
-                    except ConnectionError:
-                        raise Exception("Unable to connect to OpenAI. Please check your internet connection.")
-                    except Exception as e:
-                        raise Exception(f"OpenAI API error: {str(e)}")
-                    
-                    if not response:
-                        raise Exception("Received empty response from the agent.")
-                    
-                    # Display response
                     st.markdown(response)
-                    
-                    # Add to chat history
-                    st.session_state.chat_history.append({
-                        "role": "assistant",
-                        "content": response
-                    })
-                    
-                except Exception as e:
-                    error_message = str(e)
-                    st.error(f"Error: {error_message}")
-                    st.sidebar.error(f"Detailed error: {repr(e)}")
-                    st.sidebar.info("Try refreshing the page or checking your API key if the error persists.")
+
+                if not response:
+                    raise Exception("Received empty response from the agent.")
+                
+                # Persist the turn, starting the session on its first message
+                if session_id is None:
+                    session_id = db.create_chat_session(selected_agent.id)
+                    st.session_state.chat_session_ids[selected_agent.id] = session_id
+                    st.session_state.chat_windows[session_id] = window
+                window['messages'].extend(db.add_chat_messages(
+                    session_id,
+                    selected_agent.id,
+                    [("user", user_input), ("assistant", response)]
+                ))
+                window['context'].append("user", user_input)
+                window['context'].append("assistant", response)
+                
+            except AgentCallError as e:
+                # Already a user-facing message; the details are in the sidebar
+                st.error(str(e))
+            except Exception as e:
+                error_message = str(e)
+                st.error(f"Error: {error_message}")
+                st.sidebar.error(f"Detailed error: {repr(e)}")
+                st.sidebar.info("Try refreshing the page or checking your API key if the error persists.")
 
 # Chat controls
 with st.sidebar:
     st.write("Chat Controls")
-    if st.button("Clear Chat History"):
-        st.session_state.chat_history = []
-        st.rerun() 
\ No newline at end of file
+    st.toggle("Stream responses", key="stream_responses")
+    cache_stats = get_response_cache().stats()
+    st.caption(f"Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+    if selected_agent:
+        st.caption(f"Context: {window['context'].tokens} history tokens")
+
+        # Earlier sessions with this agent
+        sessions = db.get_chat_sessions(selected_agent.id)
+        session_key = f"chat_session_{selected_agent.id}"
+        if sessions:
+            session_ids = [row[0] for row in sessions]
+            titles = {row[0]: row[1] or f"Chat {row[0]}" for row in sessions}
+            st.selectbox(
+                "Chat Session",
+                options=session_ids,
+                index=session_ids.index(session_id) if session_id in session_ids else None,
+                format_func=lambda sid: titles[sid],
+                placeholder="New chat",
+                key=session_key,
+                on_change=lambda: st.session_state.chat_session_ids.update(
+                    {selected_agent.id: st.session_state[session_key]}
+                )
+            )
+
+        st.button("New Chat", on_click=start_new_chat, args=(selected_agent.id, session_key))
@@ -0,0 +1,92 @@
+import streamlit as st
+from utils import get_database
+from async_chat import DELTA, DONE, ERROR, fan_out
+from prompts import compile_prompt
+
+# Shared, process-wide database handle
+db = get_database()
+if 'compare_history' not in st.session_state:
+    st.session_state.compare_history = []
+
+st.header("Ask Several Agents")
+
+if not st.session_state.get('api_key'):
+    st.warning("OpenAI API key is required to chat with agents. Add it on the Chat page.")
+    st.stop()
+
+agents = db.get_agents()
+if not agents:
+    st.info("No agents found. Create one first!")
+    st.stop()
+
+selected_agents = st.multiselect(
+    "Select Agents",
+    options=agents,
+    format_func=lambda agent: agent.name
+)
+
+if not selected_agents:
+    st.info("Pick the agents that should answer your question.")
+    st.stop()
+
+# One set of parameter values, shared by every selected agent that uses them
+placeholders = dict.fromkeys(
+    param for agent in selected_agents for param in compile_prompt(agent).placeholders
+)
+param_values = {}
+if placeholders:
+    with st.expander("Parameters", expanded=True):
+        for param in placeholders:
+            param_values[param] = st.text_input(
+                param.replace('_', ' ').title(),
+                key=f"compare_param_{param}"
+            )
+
+# Display previous rounds
+for round_ in st.session_state.compare_history:
+    with st.chat_message("user"):
+        st.markdown(round_["question"])
+    columns = st.columns(len(round_["answers"]))
+    for column, (agent_name, answer) in zip(columns, round_["answers"].items()):
+        with column:
+            st.markdown(f"**{agent_name}**")
+            st.markdown(answer)
+
+user_input = st.chat_input("Ask all selected agents")
+
+if user_input:
+    with st.chat_message("user"):
+        st.markdown(user_input)
+
+    # One column per agent, each streamed as its answer arrives
+    placeholders_by_agent = {}
+    for column, agent in zip(st.columns(len(selected_agents)), selected_agents):
+        with column:
+            st.markdown(f"**{agent.name}**")
+            placeholders_by_agent[agent.id] = st.empty()
+
+    answers = {agent.id: "" for agent in selected_agents}
+    for agent_id, kind, payload in fan_out(
+        st.session_state.api_key,
+        selected_agents,
+        user_input,
+        param_values
+    ):
+        if kind == DELTA:
+            answers[agent_id] += payload
+            placeholders_by_agent[agent_id].markdown(answers[agent_id])
+        elif kind == DONE:
+            placeholders_by_agent[agent_id].markdown(answers[agent_id])
+        elif kind == ERROR:
+            answers[agent_id] = f"Error: {payload}"
+            placeholders_by_agent[agent_id].error(answers[agent_id])
+
+    st.session_state.compare_history.append({
+        "question": user_input,
+        "answers": {agent.name: answers[agent.id] for agent in selected_agents}
+    })
+
+# Chat controls
+with st.sidebar:
+    st.write("Chat Controls")
+    st.button("Clear Comparison History", on_click=lambda: st.session_state.compare_history.clear())
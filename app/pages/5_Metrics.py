@@ -0,0 +1,64 @@
+import time
+import streamlit as st
+from utils import get_database
+from metrics import METRICS_FLUSH_INTERVAL, get_metrics
+
+# Shared, process-wide database handle
+db = get_database()
+metrics = get_metrics()
+
+# Reporting windows, in seconds
+WINDOWS = {
+    "Last hour": 60 * 60,
+    "Last 24 hours": 24 * 60 * 60,
+    "Last 7 days": 7 * 24 * 60 * 60,
+    "All retained": None,
+}
+
+st.header("Agent Call Metrics")
+st.caption(f"Recorded by every app process; new calls appear within {METRICS_FLUSH_INTERVAL:.0f}s.")
+
+window = st.selectbox("Window", list(WINDOWS), index=1)
+since = time.time() - WINDOWS[window] if WINDOWS[window] else None
+summary = metrics.summary(since)
+
+if not summary:
+    st.info("No agent calls recorded in this window.")
+else:
+    names = {agent.id: agent.name for agent in db.get_agents()}
+
+    def ms(seconds):
+        return round(seconds * 1000) if seconds is not None else None
+
+    rows = []
+    for group in sorted(summary, key=lambda g: g['latency_p95'] or 0, reverse=True):
+        rows.append({
+            "Agent": names.get(group['agent_id'], f"#{group['agent_id']} (deleted)"),
+            "Prompt version": group['prompt_version'],
+            "Calls": group['calls'],
+            "Errors": group['errors'],
+            "Retries": group['retries'],
+            "Latency p50 (ms)": ms(group['latency_p50']),
+            "Latency p95 (ms)": ms(group['latency_p95']),
+            "Latency p99 (ms)": ms(group['latency_p99']),
+            "TTFT p50 (ms)": ms(group['ttft_p50']),
+            "TTFT p95 (ms)": ms(group['ttft_p95']),
+            "Queue p95 (ms)": ms(group['queue_time_p95']),
+            "Prompt tokens": group['prompt_tokens'],
+            "Completion tokens": group['completion_tokens'],
+        })
+
+    total_calls = sum(group['calls'] for group in summary)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Calls", total_calls)
+    col2.metric("Error rate", f"{sum(g['errors'] for g in summary) / total_calls:.1%}")
+    col3.metric("Tokens", sum(g['prompt_tokens'] + g['completion_tokens'] for g in summary))
+
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+
+# Prometheus text export of this process's histograms
+with st.expander("Prometheus export (this process)"):
+    exposition = metrics.prometheus()
+    st.download_button("Download metrics.txt", exposition, file_name="metrics.txt", mime="text/plain")
+    st.code(exposition, language="text")
+    st.caption("Set METRICS_PORT to also serve this at /metrics for scraping.")
@@ -0,0 +1,136 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+# {param} placeholders in stored prompt templates; other braces are left alone
+PLACEHOLDER_PATTERN = re.compile(r'\{([A-Za-z_][A-Za-z0-9_]*)\}')
+# Number of compiled agent prompts kept in memory
+COMPILED_CACHE_SIZE = 1024
+
+# Model settings used for every agent query (part of the response cache key)
+MODEL_SETTINGS = {
+    "model": "gpt-4o",
+    "temperature": 0.7,
+    "max_tokens": 1000
+}
+
+SYSTEM_PROMPT_HEADER = """You are an AI assistant specialized in {expertise}.
+Role: {name}
+Type: {agent_type}
+Description: {description}
+
+Your task is to provide information based on the following parameters:
+{parameters}
+
+"""
+SYSTEM_PROMPT_FOOTER = """
+
+Please provide detailed and accurate responses while staying within your defined expertise and parameters."""
+
+
+def find_placeholders(template):
+    """Distinct placeholder names in a prompt template, in order of first use"""
+    return tuple(dict.fromkeys(PLACEHOLDER_PATTERN.findall(template or '')))
+
+
+class CompiledPrompt:
+    """
+    A system prompt for one agent prompt version and header, parsed once.
+
+    The prompt is kept as alternating literal text and placeholder names, so
+    rendering a turn only joins strings. Everything before the first
+    placeholder (the agent header plus the start of the template) is the same
+    for every turn and forms a stable prefix for upstream prompt caching.
+    """
+    __slots__ = ('agent_id', 'version', 'literals', 'placeholders', 'fingerprint')
+
+    def __init__(self, agent):
+        self.agent_id = agent.id
+        self.version = agent.prompt_version
+
+        header = SYSTEM_PROMPT_HEADER.format(
+            expertise=agent.expertise,
+            name=agent.name,
+            agent_type=agent.agent_type,
+            description=agent.description,
+            parameters=', '.join(agent.parameters)
+        )
+
+        # literals[i] is followed by placeholders[i]; there is one more literal than placeholders
+        parts = PLACEHOLDER_PATTERN.split(agent.prompt or '')
+        literals = list(parts[0::2])
+        literals[0] = header + literals[0]
+        literals[-1] = literals[-1] + SYSTEM_PROMPT_FOOTER
+        self.literals = tuple(literals)
+        self.placeholders = tuple(parts[1::2])
+        # Identifies the exact system prompt template, for the response cache key
+        self.fingerprint = hashlib.sha256(
+            '\0'.join(self.literals + self.placeholders).encode('utf-8')
+        ).hexdigest()
+
+    def missing(self, values):
+        """Placeholders that have no value in values"""
+        return tuple(name for name in dict.fromkeys(self.placeholders) if not values.get(name))
+
+    def render(self, values=None):
+        """Substitute parameter values; placeholders without a value are left as {name}"""
+        values = values or {}
+        out = [self.literals[0]]
+        for name, literal in zip(self.placeholders, self.literals[1:]):
+            value = values.get(name)
+            out.append(str(value) if value else '{' + name + '}')
+            out.append(literal)
+        return ''.join(out)
+
+
+# Least recently used compiled prompts are evicted first
+_compiled = OrderedDict()
+_compiled_lock = threading.Lock()
+
+
+def prompt_key(agent):
+    """Everything an agent's system prompt is built from: its prompt version and header fields"""
+    return (
+        agent.id,
+        agent.prompt_version,
+        agent.name,
+        agent.expertise,
+        agent.agent_type,
+        agent.description,
+        tuple(agent.parameters)
+    )
+
+
+def compile_prompt(agent):
+    """Get the compiled prompt for an agent as it is now, compiling it on first use"""
+    key = prompt_key(agent)
+    with _compiled_lock:
+        compiled = _compiled.get(key)
+        if compiled is not None:
+            _compiled.move_to_end(key)
+            return compiled
+
+    compiled = CompiledPrompt(agent)
+    with _compiled_lock:
+        _compiled[key] = compiled
+        while len(_compiled) > COMPILED_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return compiled
+
+
+def render_system_prompt(agent, params=None):
+    """Render the system prompt for an agent with the given parameter values"""
+    return compile_prompt(agent).render(params)
+
+
+def build_chat_request(agent, user_input, params=None, history=None):
+    """Build the chat completion arguments for an agent query, after any earlier history"""
+    return {
+        "messages": [
+            {"role": "system", "content": render_system_prompt(agent, params)},
+            *(history or ()),
+            {"role": "user", "content": user_input}
+        ],
+        **MODEL_SETTINGS
+    }
@@ -0,0 +1,234 @@
+"""
+Retries, deadlines and circuit breaking for OpenAI calls.
+
+call_with_retries() runs a request function until it succeeds, retrying
+429/5xx and network errors with jittered exponential backoff (or the
+server's Retry-After) as long as the overall deadline allows. Each attempt
+gets the time left before the deadline as its timeout. A CircuitBreaker per
+endpoint counts consecutive upstream failures and, once open, fails calls
+immediately until a trial call succeeds.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+import openai
+
+# Seconds an agent call may take in total, across every retry
+CALL_DEADLINE = float(os.getenv("OPENAI_CALL_DEADLINE", "90"))
+# Longest timeout given to a single attempt
+ATTEMPT_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+# Retries after the first attempt
+CALL_RETRIES = int(os.getenv("OPENAI_CALL_RETRIES", "3"))
+# Backoff bounds in seconds
+BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "20"))
+# Consecutive upstream failures that open a circuit, and seconds it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("OPENAI_BREAKER_FAILURES", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("OPENAI_BREAKER_RESET", "30"))
+
+# HTTP statuses worth retrying
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class AgentCallError(Exception):
+    """An agent call failed; the message is fit to show to the user"""
+
+
+class CircuitOpenError(AgentCallError):
+    """The endpoint is failing and calls are being refused without trying"""
+
+
+class DeadlineExceededError(AgentCallError):
+    """The call ran out of time before it could succeed"""
+
+
+def is_retryable(error):
+    """Whether an error from the OpenAI client is worth retrying"""
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUSES
+
+
+def retry_delay(error, attempt, base_delay=BACKOFF_BASE, max_delay=BACKOFF_MAX):
+    """Seconds to wait before the next attempt, honouring Retry-After"""
+    response = getattr(error, 'response', None)
+    if response is not None:
+        retry_after = response.headers.get('retry-after')
+        if retry_after:
+            try:
+                return min(float(retry_after), max_delay)
+            except ValueError:
+                pass
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Closed, it lets every call through. After failure_threshold upstream
+    failures in a row it opens and refuses calls for reset_timeout seconds,
+    then lets a single trial call through: success closes it again, failure
+    reopens it.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go ahead now"""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            if remaining <= 0 and not self._trial_running:
+                self._trial_running = True
+                return
+        raise CircuitOpenError(
+            f"OpenAI is failing right now. Please try again in {max(remaining, 1):.0f}s."
+        )
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(base_url=None):
+    """Get the process-wide circuit breaker for an endpoint"""
+    breaker = _breakers.get(base_url)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(base_url, CircuitBreaker())
+    return breaker
+
+
+def _record(breaker, error):
+    """Count an error against the breaker if it says the upstream is unhealthy"""
+    if breaker is None:
+        return
+    if error is None:
+        breaker.record_success()
+    elif is_retryable(error):
+        breaker.record_failure()
+    else:
+        # The endpoint answered; a bad request or key says nothing about its health
+        breaker.record_success()
+
+
+def _next_delay(error, attempt, retries, deadline_at):
+    """Delay before retrying after a failed attempt, or None to give up"""
+    if attempt > retries or not is_retryable(error):
+        return None
+    delay = retry_delay(error, attempt - 1)
+    if time.monotonic() + delay >= deadline_at:
+        return None
+    return delay
+
+
+def _attempt_timeout(deadline_at):
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceededError("The request timed out. Please try again.")
+    return min(ATTEMPT_TIMEOUT, remaining)
+
+
+def call_with_retries(request, deadline=CALL_DEADLINE, retries=CALL_RETRIES, breaker=None, on_retry=None):
+    """
+    Call request(timeout) until it succeeds, retries run out or the deadline passes.
+
+    request receives the seconds the attempt may take. on_retry(attempt,
+    error, delay) is called before each wait. The last error is raised
+    unchanged when the call gives up.
+    """
+    deadline_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        attempt += 1
+        timeout = _attempt_timeout(deadline_at)
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = request(timeout)
+        except Exception as e:
+            _record(breaker, e)
+            delay = _next_delay(e, attempt, retries, deadline_at)
+            if delay is None:
+                raise
+            if on_retry is not None:
+                on_retry(attempt, e, delay)
+            time.sleep(delay)
+            continue
+        _record(breaker, None)
+        return result
+
+
+async def acall_with_retries(request, deadline=CALL_DEADLINE, retries=CALL_RETRIES, breaker=None, on_retry=None):
+    """call_with_retries for a coroutine function, waiting with asyncio.sleep"""
+    deadline_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        attempt += 1
+        timeout = _attempt_timeout(deadline_at)
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = await request(timeout)
+        except Exception as e:
+            _record(breaker, e)
+            delay = _next_delay(e, attempt, retries, deadline_at)
+            if delay is None:
+                raise
+            if on_retry is not None:
+                on_retry(attempt, e, delay)
+            await asyncio.sleep(delay)
+            continue
+        _record(breaker, None)
+        return result
+
+
+def describe_error(error):
+    """A short message telling the user what went wrong and what to do"""
+    if isinstance(error, AgentCallError):
+        return str(error)
+    if isinstance(error, openai.AuthenticationError):
+        return "OpenAI rejected the API key. Please verify your API key is correct."
+    if isinstance(error, openai.RateLimitError):
+        return "OpenAI is rate limiting requests. Please wait a moment and try again."
+    if isinstance(error, (openai.APITimeoutError, httpx.TimeoutException)):
+        return "The request timed out. Please try again."
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return "Unable to connect to OpenAI. Please check your internet connection and try again."
+    if isinstance(error, openai.APIStatusError):
+        return f"OpenAI returned an error ({error.status_code}). Please try again later."
+    return f"Failed to process query: {error}"
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Stored next to agents.db (same working directory)
+CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "response_cache.db")
+CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(24 * 60 * 60)))
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+
+
+def normalize_input(user_input):
+    """Normalize a user message so trivially different spellings share an entry"""
+    return " ".join(user_input.split()).casefold()
+
+
+class ResponseCache:
+    """SQLite-backed cache of agent responses with TTL and LRU eviction"""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS response_cache (
+            cache_key TEXT PRIMARY KEY,
+            agent_id INTEGER NOT NULL,
+            prompt_version INTEGER,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL,
+            hit_count INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_agent ON response_cache (agent_id)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_lru ON response_cache (last_used_at)')
+        self.conn.commit()
+        self._size = self.conn.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+    @staticmethod
+    def make_key(agent_id, prompt_version, settings, user_input, params=None, system_prompt=None):
+        """
+        Build the cache key from the agent, its prompt version, model settings and input.
+
+        system_prompt is the compiled prompt's fingerprint, so editing the
+        agent's name, description or parameters also changes the key.
+        """
+        payload = json.dumps(
+            [agent_id, prompt_version, settings, normalize_input(user_input), params or {}, system_prompt],
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached response for a key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute('''
+            SELECT response FROM response_cache
+            WHERE cache_key = ? AND created_at > ?
+            ''', (key, now - self.ttl)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.conn.execute('''
+            UPDATE response_cache SET last_used_at = ?, hit_count = hit_count + 1
+            WHERE cache_key = ?
+            ''', (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, agent_id, prompt_version, response):
+        """Store a response, evicting least recently used entries past the size bound"""
+        now = time.time()
+        with self._lock:
+            exists = self.conn.execute(
+                'SELECT 1 FROM response_cache WHERE cache_key = ?', (key,)
+            ).fetchone()
+            self.conn.execute('''
+            INSERT OR REPLACE INTO response_cache
+                (cache_key, agent_id, prompt_version, response, created_at, last_used_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', (key, agent_id, prompt_version, response, now, now))
+            if not exists:
+                self._size += 1
+
+            if self._size > self.max_entries:
+                # Drop expired entries first, then the least recently used ones
+                self.conn.execute('DELETE FROM response_cache WHERE created_at <= ?', (now - self.ttl,))
+                self.conn.execute('''
+                DELETE FROM response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM response_cache
+                    ORDER BY last_used_at ASC
+                    LIMIT MAX((SELECT COUNT(*) FROM response_cache) - ?, 0)
+                )
+                ''', (self.max_entries,))
+                self._size = self.conn.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+            self.conn.commit()
+
+    def invalidate_agent(self, agent_id):
+        """Drop every cached response for an agent (e.g. after a new prompt version)"""
+        with self._lock:
+            cursor = self.conn.execute('DELETE FROM response_cache WHERE agent_id = ?', (agent_id,))
+            self._size -= cursor.rowcount
+            self.conn.commit()
+
+    def stats(self):
+        """Hit/miss counters for this process and the current number of entries"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': self._size
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Get the process-wide response cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -1,80 +1,164 @@
-from openai import OpenAI
+import atexit
+import os
+import time
 import streamlit as st
-import httpx
+from database import Database
+from openai_client import KEY_VALID, OPENAI_BASE_URL, check_api_key, get_client
+from resilience import (
+    CALL_DEADLINE, AgentCallError, DeadlineExceededError, call_with_retries, describe_error, get_breaker
+)
+from metrics import CallTimer
+from response_cache import get_response_cache
+from prompts import MODEL_SETTINGS, build_chat_request, compile_prompt
 
-OPENAI_API_KEY = st.secrets.get("OPENAI_API_KEY")
+try:
+    OPENAI_API_KEY = st.secrets.get("OPENAI_API_KEY")
+except FileNotFoundError:
+    # No secrets.toml, e.g. when imported by the benchmark outside Streamlit
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+@st.cache_resource
+def get_database():
+    """
+    Get the Database shared by every session in this server process.
+
+    The schema is set up once when it is first created, and its connections
+    are closed when the process exits.
+    """
+    db = Database()
+    atexit.register(db.close)
+    return db
+
+def flash(message, kind='success'):
+    """Queue a message for the next page render (kind is 'success' or 'error')"""
+    st.session_state[f'{kind}_message'] = message
+
+def show_flash():
+    """Show and clear any queued success or error message"""
+    if st.session_state.get('error_message'):
+        st.error(st.session_state.error_message)
+        st.session_state.error_message = None
+
+    if st.session_state.get('success_message'):
+        st.success(st.session_state.success_message)
+        st.session_state.success_message = None
 
 def validate_api_key(api_key):
-    try:
-        client = OpenAI(api_key=api_key)
-        client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "system", "content": "Test"}]
-        )
-        print("API key validated successfully!", client)
-        return True
-    except Exception:
-        return False
+    """Check an API key by listing models; results are cached per key for API_KEY_CHECK_TTL"""
+    return check_api_key(api_key) == KEY_VALID
+
+def _cache_key(agent, user_input, params=None):
+    """Response cache key for an agent query"""
+    return get_response_cache().make_key(
+        agent.id,
+        agent.prompt_version,
+        MODEL_SETTINGS,
+        user_input,
+        params,
+        compile_prompt(agent).fingerprint
+    )
+
+def _query_error(e):
+    """Report a failed agent query and wrap it with a user-facing message"""
+    st.sidebar.error(f"Error details: {e!r}")
+    return AgentCallError(describe_error(e))
+
+def _cached_response(agent, user_input, params, history):
+    """Look up a response; returns (cache key, cached text or None)"""
+    # Answers that depend on earlier turns are not reusable across conversations
+    if history:
+        return None, None
+    cache_key = _cache_key(agent, user_input, params)
+    return cache_key, get_response_cache().get(cache_key)
 
-def process_agent_query(api_key, agent_data, user_input):
+def process_agent_query(api_key, agent, user_input, params=None, history=None):
     """
     Process a user query using the specified agent
     
     Args:
         api_key: OpenAI API key
-        agent_data: Dictionary containing agent information
+        agent: Agent to answer the query
         user_input: User's message
+        params: Values for the {param} placeholders in the agent's prompt
+        history: Earlier conversation messages, e.g. ConversationContext.messages()
     """
+    cache_key, cached = _cached_response(agent, user_input, params, history)
+    if cached is not None:
+        return cached
+
+    timer = CallTimer(agent)
+    timer.started()
     try:
-        # Add debug logging
-        st.sidebar.info("Initializing OpenAI client...")
-        
-        # Create new client with explicit timeout
-        client = OpenAI(
-            api_key=api_key,
-            http_client=httpx.Client(verify=False)
-        )
-        
-        # Store client in session state for reuse
-        st.session_state['openai_client'] = client
-        
-        # Add debug logging
-        st.sidebar.info("Making API call...")
-        
-        # Construct system prompt using agent data
-        system_prompt = f"""You are an AI assistant specialized in {agent_data['expertise']}.
-Role: {agent_data['name']}
-Type: {agent_data['type']}
-Description: {agent_data['description']}
-
-Your task is to provide information based on the following parameters:
-{', '.join(agent_data['parameters'])}
-
-{agent_data['prompt']}
-
-Please provide detailed and accurate responses while staying within your defined expertise and parameters."""
-
-        # Make API call
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_input}
-            ],
-            temperature=0.7,
-            max_tokens=1000
+        # Reuse the process-wide pooled client for this key; retries happen here
+        client = get_client(api_key).with_options(max_retries=0)
+        request = build_chat_request(agent, user_input, params, history)
+
+        # Make API call, retrying 429/5xx within the call deadline
+        response = call_with_retries(
+            lambda timeout: client.chat.completions.create(**request, timeout=timeout),
+            breaker=get_breaker(OPENAI_BASE_URL),
+            on_retry=timer.retried
         )
+        timer.first_token()
         
         # Extract and return response
-        return response.choices[0].message.content
-        
+        content = response.choices[0].message.content
+    except Exception as e:
+        timer.finish(error=e)
+        raise _query_error(e) from e
+    timer.finish(response.usage)
+
+    if content and cache_key:
+        get_response_cache().put(cache_key, agent.id, agent.prompt_version, content)
+    return content
+
+def stream_agent_query(api_key, agent, user_input, params=None, history=None):
+    """
+    Stream a user query response from the specified agent
+
+    Same arguments as process_agent_query, but yields the response text in
+    deltas as they arrive instead of waiting for the full completion.
+    A cached response is yielded in one piece.
+    """
+    cache_key, cached = _cached_response(agent, user_input, params, history)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    usage = None
+    timer = CallTimer(agent)
+    timer.started()
+    try:
+        client = get_client(api_key).with_options(max_retries=0)
+        request = build_chat_request(agent, user_input, params, history)
+        deadline_at = time.monotonic() + CALL_DEADLINE
+
+        # Only opening the stream is retried; text already shown can't be taken back
+        stream = call_with_retries(
+            lambda timeout: client.chat.completions.create(
+                **request, stream=True, stream_options={"include_usage": True}, timeout=timeout
+            ),
+            deadline=CALL_DEADLINE,
+            breaker=get_breaker(OPENAI_BASE_URL),
+            on_retry=timer.retried
+        )
+        with stream:
+            for chunk in stream:
+                if time.monotonic() > deadline_at:
+                    raise DeadlineExceededError("The response took too long and was cut off. Please try again.")
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    timer.first_token()
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+
     except Exception as e:
-        # More detailed error handling
-        error_msg = f"Error details: {str(e)}"
-        if "Connection" in str(e):
-            error_msg += "\nPlease check your internet connection and try again."
-        elif "Authentication" in str(e):
-            error_msg += "\nPlease verify your API key is correct."
-            
-        st.sidebar.error(error_msg)
-        raise Exception(f"Failed to process query: {error_msg}")
\ No newline at end of file
+        timer.finish(error=e)
+        raise _query_error(e) from e
+    timer.finish(usage)
+
+    # Only complete responses are cached
+    if parts and cache_key:
+        get_response_cache().put(cache_key, agent.id, agent.prompt_version, ''.join(parts))